@@ -1,14 +1,38 @@
-from cassowary import SimplexSolver, Variable, WEAK
+import abc
+from cassowary import SimplexSolver, Variable, RequiredFailure, WEAK
 from collections import OrderedDict
 
 space = 20
 
 
+opposite = {'north': 'south', 'south': 'north', 'east': 'west', 'west': 'east'}
+axes = {'north': 'vertical', 'south': 'vertical', 'east': 'horizontal', 'west': 'horizontal'}
+
+
 class Constraint:
+    """
+    Immutable constraint on the positions of two boxes : box1 is at the direction of box2.
+    Its canonical key (first box, direction, second box), where the boxes are ordered by identity
+    and the direction is given from the first box, is computed once : two constraints are equal
+    (e.g., a north of b and b south of a) if and only if they have the same key.
+
+    :param box1: the first box
+    :param direction: 'north' | 'south' | 'east' | 'west'
+    :param box2: the second box
+    """
+    __slots__ = ('_box1', '_direction', '_box2', '_key', '_hash')
+
     def __init__(self, box1, direction, box2):
+        if direction not in opposite:
+            raise ValueError('unknown direction: ' + repr(direction))
         self._box1 = box1
-        self._box2 = box2
         self._direction = direction
+        self._box2 = box2
+        if id(box1) <= id(box2):
+            self._key = (box1, direction, box2)
+        else:
+            self._key = (box2, opposite[direction], box1)
+        self._hash = hash(self._key)
 
     @property
     def box1(self):
@@ -22,12 +46,19 @@ class Constraint:
     def direction(self):
         return self._direction
 
+    @property
+    def key(self):
+        """
+        :return: the canonical key (first box, direction, second box) of the constraint
+        """
+        return self._key
+
+    def __reduce__(self):
+        return self.__class__, (self._box1, self._direction, self._box2)
+
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            opposite = {'north': 'south', 'south': 'north', 'east': 'west', 'west': 'east'}
-            return (self._box1 == other._box1 and self.direction == other.direction and self._box2 == other.box2) or \
-                   (self._box1 == other._box2 and self.direction == opposite[
-                       other.direction] and self._box2 == other.box1)
+            return self._key == other._key
         else:
             return False
 
@@ -35,21 +66,177 @@ class Constraint:
         return not self.__eq__(other)
 
     def __hash__(self):
-        opposite = {'north': 'south', 'south': 'north', 'east': 'west', 'west': 'east'}
-        if self.direction == 'north' or self.direction == 'west':
-            return ((hash(self.box1.name) + 13) ^ (hash(self.direction) + 13)) + (hash(opposite[self.direction]) ^ hash(
-                self.box2.name))
-        else:
-            return (hash(self.box1.name) ^ hash(self.direction)) + ((hash(opposite[self.direction]) + 13) ^ (
-                hash(self.box2.name) + 13))
+        return self._hash
 
     def __repr__(self):
         return 'Constraint(' + self.box1.name + ', ' + self.direction + ', ' + self.box2.name + ')'
 
 
+class InfeasibleConstraintsError(Exception):
+    """
+    Raised when the constraints on the boxes contradict each other (e.g., a north of b, b north of c
+    and c north of a).
+
+    :param constraints: the constraints that form a cycle
+    """
+
+    def __init__(self, constraints):
+        super().__init__('contradictory constraints : ' + ', '.join(map(repr, constraints)))
+        self.constraints = constraints
+
+
+def precedence(constraint):
+    """
+    :return: the tuple (first box, second box, axis) meaning that the first box has to be
+             before the second one on the axis, following the constraint in parameter
+    """
+    box1, direction, box2 = constraint.key
+    if direction == 'north' or direction == 'west':
+        return box1, box2, axes[direction]
+    else:
+        return box2, box1, axes[direction]
+
+
+class PrecedenceGraph:
+    """
+    Directed graph of the precedences between boxes on an axis.
+    A topological order of the boxes is maintained when an edge is added (Pearce-Kelly algorithm) :
+    only the boxes between the two ends of the new edge in this order are visited,
+    and a cycle is detected as soon as it is closed.
+    """
+
+    def __init__(self):
+        self._successors = {}  # Box -> {Box: Constraint}
+        self._predecessors = {}  # Box -> {Box: Constraint}
+        self._order = {}  # Box -> position in the topological order
+        self._first, self._last = 0, -1  # the positions at both ends of the order
+
+    def _add_node(self, node, first):
+        """
+        Add a node at the beginning (or the end) of the topological order if it is not in the graph yet.
+        """
+        if node not in self._order:
+            self._successors[node], self._predecessors[node] = OrderedDict(), OrderedDict()
+            if first:
+                self._first -= 1
+                self._order[node] = self._first
+            else:
+                self._last += 1
+                self._order[node] = self._last
+
+    def add_edge(self, first, second, constraint):
+        """
+        Add the precedence first -> second.
+        :raise InfeasibleConstraintsError: if the edge closes a cycle (the graph is not modified)
+        """
+        if first == second:
+            raise InfeasibleConstraintsError([constraint])
+        self._add_node(first, True)
+        self._add_node(second, False)
+        lower, upper = self._order[second], self._order[first]
+        if lower < upper:
+            # the nodes reachable from the second box that are before the first one
+            forward, parents = [second], {second: None}
+            for node in forward:
+                for successor, c in self._successors[node].items():
+                    if successor == first:
+                        cycle = [c]
+                        while parents[node] is not None:
+                            node, c = parents[node]
+                            cycle.insert(0, c)
+                        raise InfeasibleConstraintsError([constraint] + cycle)
+                    if successor not in parents and self._order[successor] < upper:
+                        parents[successor] = (node, c)
+                        forward.append(successor)
+            # the nodes reaching the first box that are after the second one
+            backward, visited = [first], {first}
+            for node in backward:
+                for predecessor in self._predecessors[node].keys():
+                    if predecessor not in visited and self._order[predecessor] > lower:
+                        visited.add(predecessor)
+                        backward.append(predecessor)
+            # the backward nodes take the first positions, keeping their relative order
+            nodes = sorted(backward, key=self._order.get) + sorted(forward, key=self._order.get)
+            positions = sorted(map(self._order.get, nodes))
+            for node, position in zip(nodes, positions):
+                self._order[node] = position
+        self._successors[first][second] = constraint
+        self._predecessors[second][first] = constraint
+
+    def remove_edge(self, first, second):
+        """
+        Remove the precedence first -> second (the topological order stays valid).
+        """
+        del self._successors[first][second]
+        del self._predecessors[second][first]
+
+
+class ConstraintStore:
+    """
+    The constraints on the children of a compound Box, indexed by pair of boxes and axis.
+    The precedence graphs of the constraints are maintained so that a contradiction (a north of b and
+    b north of a) is found in constant time and a cycle (a north of b, b north of c, c north of a) is
+    detected when the constraint closing it is added.
+    """
+
+    def __init__(self):
+        self._constraints = OrderedDict()  # (first box, axis, second box) of the key -> Constraint
+        self._graphs = {'horizontal': PrecedenceGraph(), 'vertical': PrecedenceGraph()}
+
+    @staticmethod
+    def _index(constraint):
+        box1, direction, box2 = constraint.key
+        return box1, axes[direction], box2
+
+    def opposite(self, constraint):
+        """
+        :return: the constraint of the store that contradicts the constraint in parameter, or None
+        """
+        existing = self._constraints.get(self._index(constraint))
+        if existing is not None and existing.key != constraint.key:
+            return existing
+        return None
+
+    def add(self, constraint):
+        """
+        Add a constraint. Nothing happens if an equal constraint is already in the store.
+        :raise InfeasibleConstraintsError: if the constraint contradicts the constraints of the store
+        """
+        index = self._index(constraint)
+        existing = self._constraints.get(index)
+        if existing is None:
+            first, second, axis = precedence(constraint)
+            self._graphs[axis].add_edge(first, second, constraint)
+            self._constraints[index] = constraint
+        elif existing.key != constraint.key:
+            raise InfeasibleConstraintsError([existing, constraint])
+
+    def remove(self, constraint):
+        """
+        Remove the constraint (or the equal one) from the store.
+        """
+        del self._constraints[self._index(constraint)]
+        first, second, axis = precedence(constraint)
+        self._graphs[axis].remove_edge(first, second)
+
+    def __contains__(self, constraint):
+        return self._constraints.get(self._index(constraint)) == constraint
+
+    def __iter__(self):
+        return iter(self._constraints.values())
+
+    def __len__(self):
+        return len(self._constraints)
+
+    def __repr__(self):
+        return 'ConstraintStore(' + ', '.join(map(repr, self)) + ')'
+
+
 class BoxWithConstraints:
     """
-    Box decorator for the resolution of constraints
+    Box decorator for the resolution of constraints.
+    The dimensions and the additional space of the box are constants of the problem :
+    when they change, the problem is built again.
     """
 
     def __init__(self, box, dimensions):
@@ -57,7 +244,7 @@ class BoxWithConstraints:
         self._x = Variable(box.name + ' x', 0)
         self._y = Variable(box.name + ' y', 0)
         self._width, self._height = dimensions[box]
-        self._space = box.additional_space
+        self._space = tuple(box.additional_space)
 
     @property
     def box(self):
@@ -83,6 +270,13 @@ class BoxWithConstraints:
     def height(self):
         return self._height
 
+    @property
+    def values(self):
+        """
+        :return: the dimensions and the additional space (width, height, left, top, right, bottom) of the box
+        """
+        return (self._width, self._height) + self._space
+
     @property
     def name(self):
         return self.box.name
@@ -91,87 +285,437 @@ class BoxWithConstraints:
         return 'decorator<' + self.box.__repr__() + '>'
 
 
-def resolve(parent, dimensions, children, constraint_list):
+class Solver(abc.ABC):
     """
-    Resolve a coordinates problem. The coordinates of the children entered in parameter will be computed.
+    Resolution of the coordinates of the children of a compound Box.
+    A solver is created for a parent and kept with it between the resolutions.
 
-    :param parent: the main box that contains the children entered in parameter
-    :param dimensions: the dict of children's dimensions
-    :param children: the children to dispose in the parent's box
-    :param constraint_list: the list of constraints
-    :return: the dict that contains the coordinates of the children in parameter
+    :param parent: the main box that contains the children to dispose
     """
 
-    if parent.orthogonal_state:
-        if parent.axis == 'horizontal':
-            height = max(map(lambda child: dimensions[child][1], parent.children))
-            for child in parent.children:
-                w, h = dimensions[child]
-                dimensions[child] = (w, height)
+    def __init__(self, parent):
+        self._parent = parent
+
+    @abc.abstractmethod
+    def resolve(self, dimensions, children, constraint_list):
+        """
+        Resolve the coordinates problem.
+
+        :param dimensions: the dict of children's dimensions
+        :param children: the children to dispose in the parent's box
+        :param constraint_list: the list of constraints
+        :return: the dict that contains the coordinates of the children in parameter
+        :raise InfeasibleConstraintsError: if the constraints contradict each other
+        """
+
+    def fit_orthogonal_state(self, dimensions):
+        """
+        Give the same height (or width for a vertical axis) to the parallel states of the parent.
+        :param dimensions: the dict of children's dimensions, updated in place
+        """
+        parent = self._parent
+        if parent.orthogonal_state:
+            if parent.axis == 'horizontal':
+                height = max(map(lambda child: dimensions[child][1], parent.children))
+                for child in parent.children:
+                    w, h = dimensions[child]
+                    dimensions[child] = (w, height)
+            else:
+                width = max(map(lambda child: dimensions[child][0], parent.children))
+                for child in parent.children:
+                    w, h = dimensions[child]
+                    dimensions[child] = (width, h)
+
+
+class CassowarySolver(Solver):
+    """
+    Persistent resolution of the coordinates of the children of a compound Box.
+    The Cassowary solver and the variables of the children are kept between the resolutions,
+    but only the additions are incremental : the new children, orders and user constraints are added
+    to the problem already solved.
+    The simplex of Cassowary has no rule against cycling, and removing a constraint from these degenerate
+    problems or editing one of their variables may pivot forever. So any other change (a child removed
+    or resized, a user constraint removed, a new header or axis) builds the problem again from scratch,
+    in the same order as a first resolution. Since a new constraint usually resizes the box it is added to,
+    the ancestors of that box are built again too.
+    The solutions of the last problems are kept, by header, axis, dimensions and additional spaces of the children,
+    and user constraints : a problem already solved is not solved again. Placing the texts of the transitions
+    sets the additional spaces of the boxes one after the other, and goes through the same problems as long as
+    the statechart does not change.
+
+    :param parent: the main box that contains the children to dispose
+    """
+    # the number of solutions kept
+    solutions = 256
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self._solutions = OrderedDict()  # the key of a problem -> its solution
+        self._reset()
+
+    def _reset(self):
+        self._solver = SimplexSolver()
+
+        # dimension of the frame, the top left corner stays at (0, header)
+        self._header = self._parent.header
+        self._axis = self._parent.axis
+        self._left = Variable('left', 0)
+        self._top = Variable('top', self._header)
+        self._right = Variable('right', 0)
+        self._bottom = Variable('bottom', 0)
+        self._solver.add_stay(self._left)
+        self._solver.add_stay(self._top)
+
+        self._boxes = OrderedDict()  # type: Dict[Box, BoxWithConstraints]
+        self._orders = set()  # the pairs (Box, Box) whose order is in the problem
+        self._constraints = set()  # the user constraints in the problem
+
+    def resolve(self, dimensions, children, constraint_list):
+        parent = self._parent
+        self.fit_orthogonal_state(dimensions)
+
+        # user constraints : Cassowary does not detect all their cycles, which are found first
+        precedences = {}
+        for constraint in constraint_list:
+            first, second, axis = precedence(constraint)
+            precedences.setdefault(axis, PrecedenceGraph()).add_edge(first, second, constraint)
+        constraints = set(constraint_list)
+        problem = parent.header, parent.axis, \
+            tuple((child, tuple(dimensions[child]), tuple(child.additional_space)) for child in children), \
+            frozenset(constraints)
+        if problem in self._solutions:
+            self._solutions.move_to_end(problem)
+            return self._solutions[problem]
+        order = order_pairs(children, constraints)
+        if self._outdated(dimensions, children, constraints, order):
+            self._reset()
+
+        # children, each followed by its order with the next children
+        new = {child for child in children if child not in self._boxes}
+        for child in children:
+            if child in new:
+                self._boxes[child] = BoxWithConstraints(child, dimensions)
+        index = {child: i for i, child in enumerate(children)}
+        pairs = OrderedDict()
+        for key in sorted(order, key=lambda pair: (index[pair[0]], index[pair[1]])):
+            if key not in self._orders:
+                pairs.setdefault(key[0], []).append(key)
+        for child in children:
+            if child in new:
+                self._add_box(self._boxes[child])
+            for key in pairs.get(child, ()):
+                self._add_order_constraint(self._boxes[key[0]], self._boxes[key[1]])
+                self._orders.add(key)
+
+        for constraint in constraint_list:
+            if constraint not in self._constraints:
+                try:
+                    self._add_user_constraint(constraint)
+                    self._constraints.add(constraint)
+                except RequiredFailure:
+                    # the constraint is not added, the previous ones are kept
+                    raise InfeasibleConstraintsError([constraint]) from None
+
+        boxes = [self._boxes[child] for child in children]
+        width, height = max(map(lambda box: box.x.value + box.values[0] + box.values[4] + space, boxes)), \
+                        max(map(lambda box: box.y.value + box.values[1] + box.values[5] + space, boxes))
+        new_coordinates = OrderedDict({parent: (0, 0, width, height)})
+        for box in boxes:
+            w, h = box.values[:2]
+            new_coordinates[box.box] = (box.x.value, box.y.value, box.x.value + w, box.y.value + h)
+        self._solutions[problem] = new_coordinates
+        if len(self._solutions) > self.solutions:
+            self._solutions.popitem(last=False)
+        return new_coordinates
+
+    def _outdated(self, dimensions, children, constraints, order):
+        """
+        :return: True if a constraint of the problem already solved has to be removed
+        """
+        parent = self._parent
+        if self._header != parent.header or self._axis != parent.axis:
+            return True
+        if not set(self._boxes.keys()) <= set(children):
+            return True
+        if any(box.values != tuple(dimensions[child]) + tuple(child.additional_space)
+               for child, box in self._boxes.items()):
+            return True
+        return not self._constraints <= constraints or not self._orders <= order
+
+    def _add_box(self, box):
+        x1, y1, x2, y2 = box.space
+        self._solver.add_constraint(box.x > self._left + space + x1)
+        self._solver.add_constraint(box.y > self._top + space + y1)
+        self._solver.add_constraint(box.x + box.width + x2 + space < self._right)
+        self._solver.add_constraint(box.y + box.height + y2 + space < self._bottom)
+        self._add_center_constraint(box)
+
+    def _add_center_constraint(self, box):
+        x1, y1, x2, y2 = box.space
+        if self._axis == 'horizontal':
+            self._solver.add_constraint(
+                box.y + y1 - self._top == self._bottom - box.y - box.height - y2, strength=WEAK)
         else:
-            width = max(map(lambda child: dimensions[child][0], parent.children))
-            for child in parent.children:
-                w, h = dimensions[child]
-                dimensions[child] = (width, h)
-
-    boxes = list(map(lambda child: BoxWithConstraints(child, dimensions), children))
-    constraints = list(map(lambda constraint: Constraint(next(filter(lambda x: x.box == constraint.box1, boxes),
-                                                              BoxWithConstraints(constraint.box1, dimensions)),
-                                                         constraint.direction,
-                                                         next(filter(lambda x: x.box == constraint.box2, boxes),
-                                                              BoxWithConstraints(constraint.box2, dimensions))),
-                           constraint_list))
-
-    def add_constraint(solver, constraint):
-        box1 = constraint.box1
-        box2 = constraint.box2
+            self._solver.add_constraint(
+                box.x + x1 - self._left == self._right - box.x - box.width - x2, strength=WEAK)
+
+    def _add_order_constraint(self, b1, b2):
+        x1, y1, x2, y2 = b1.space
+        x3, y3, x4, y4 = b2.space
+        if self._axis == 'horizontal':
+            self._solver.add_constraint(b2.x > b1.x + b1.width + space + x2 + x3, strength=WEAK)
+        else:
+            self._solver.add_constraint(b2.y > b1.y + b1.height + space + y2 + y3, strength=WEAK)
+
+    def _add_user_constraint(self, constraint):
+        box1 = self._boxes[constraint.box1]
+        box2 = self._boxes[constraint.box2]
         x1, y1, x2, y2 = box1.space
         x3, y3, x4, y4 = box2.space
         {
-            'north': lambda: solver.add_constraint(box1.y + box1.height + y2 + space + y3 < box2.y),
-            'east': lambda: solver.add_constraint(box1.x > box2.x + box2.width + x4 + space + x1),
-            'south': lambda: solver.add_constraint(box1.y > box2.y + box2.height + y4 + space + y1),
-            'west': lambda: solver.add_constraint(box1.x + box1.width + x2 + space + x3 < box2.x)
+            'north': lambda: self._solver.add_constraint(box1.y + box1.height + y2 + space + y3 < box2.y),
+            'east': lambda: self._solver.add_constraint(box1.x > box2.x + box2.width + x4 + space + x1),
+            'south': lambda: self._solver.add_constraint(box1.y > box2.y + box2.height + y4 + space + y1),
+            'west': lambda: self._solver.add_constraint(box1.x + box1.width + x2 + space + x3 < box2.x)
         }[constraint.direction]()
 
-    solver = SimplexSolver()
-
-    # dimension of the frame
-    left_limit = Variable('left', 0)
-    top_limit = Variable('top', parent.header)
-    right_limit = Variable('right', 0)
-    bot_limit = Variable('bottom', 0)
 
-    # define the base constraints (stay)
-    solver.add_stay(left_limit)
-    solver.add_stay(top_limit)
+class DifferenceSolver(Solver):
+    """
+    Resolution of the coordinates of the children of a compound Box as longest paths in the graphs
+    of the difference constraints (one graph per axis) : every constraint is an inequality
+    pos(box2) >= pos(box1) + offset.
+    The children are placed as close as possible to the top left corner of their parent, and
+    centered on the axis that is orthogonal to the axis of the parent, as far as the constraints allow it.
+    The contradictions between the constraints are detected before the resolution.
+
+    :param parent: the main box that contains the children to dispose
+    """
 
-    for i in range(len(boxes)):
-        b1 = boxes[i]
-        x1, y1, x2, y2 = b1.space
-        solver.add_constraint(b1.x > left_limit + space + x1)
-        solver.add_constraint(b1.y > top_limit + space + y1)
-        solver.add_constraint(b1.x + b1.width + x2 + space < right_limit)
-        solver.add_constraint(b1.y + b1.height + y2 + space < bot_limit)
+    def resolve(self, dimensions, children, constraint_list):
+        parent = self._parent
+        self.fit_orthogonal_state(dimensions)
+        sizes = {child: tuple(dimensions[child]) for child in children}
+        spaces = {child: child.additional_space for child in children}
+        top = parent.header
+
+        # graphs of the difference constraints : box1 -> [(box2, offset, constraint)]
+        x_graph = OrderedDict((child, []) for child in children)
+        y_graph = OrderedDict((child, []) for child in children)
+
+        def x_offset(box1, box2):
+            return sizes[box1][0] + spaces[box1][2] + space + spaces[box2][0]
+
+        def y_offset(box1, box2):
+            return sizes[box1][1] + spaces[box1][3] + space + spaces[box2][1]
+
+        for constraint in constraint_list:
+            box1, box2 = constraint.box1, constraint.box2
+            {
+                'north': lambda: y_graph[box1].append((box2, y_offset(box1, box2), constraint)),
+                'east': lambda: x_graph[box2].append((box1, x_offset(box2, box1), constraint)),
+                'south': lambda: y_graph[box2].append((box1, y_offset(box2, box1), constraint)),
+                'west': lambda: x_graph[box1].append((box2, x_offset(box1, box2), constraint))
+            }[constraint.direction]()
+        for graph in [x_graph, y_graph]:
+            cycle = find_cycle(graph)
+            if cycle:
+                raise InfeasibleConstraintsError(cycle)
+
+        # the order of the children is weak : it is dropped when it contradicts the constraints
+        graph, offset = {'horizontal': (x_graph, x_offset), 'vertical': (y_graph, y_offset)}[parent.axis]
+        constrained = any(graph.values())
+        index = {child: i for i, child in enumerate(children)}
+        for b1, b2 in sorted(order_pairs(children, constraint_list), key=lambda pair: (index[pair[0]], index[pair[1]])):
+            if not constrained or not reachable(graph, b2, b1):
+                graph[b1].append((b2, offset(b1, b2), None))
+
+        x = longest_paths(x_graph, {child: space + spaces[child][0] for child in children})
+        y = longest_paths(y_graph, {child: top + space + spaces[child][1] for child in children})
+
+        # center the children on the orthogonal axis
         if parent.axis == 'horizontal':
-            solver.add_constraint(b1.y + y1 - top_limit == bot_limit - b1.y - b1.height - y2, strength=WEAK)
+            y = self._center(y_graph, y, top, lambda child: sizes[child][1], lambda child: spaces[child][1::2])
         else:
-            solver.add_constraint(b1.x + x1 - left_limit == right_limit - b1.x - b1.width - x2, strength=WEAK)
-        for b2 in boxes[i + 1:]:
-            if not (any(filter(lambda constraint: b1 in [constraint.box1, constraint.box2] \
-                    and b2 in [constraint.box1, constraint.box2], constraints))):
-                x3, y3, x4, y4 = b2.space
-                if parent.axis == 'horizontal':
-                    solver.add_constraint(b2.x > b1.x + b1.width + space + x2 + x3, strength=WEAK)
-                else:
-                    solver.add_constraint(b2.y > b1.y + b1.height + space + y2 + y3, strength=WEAK)
-
-    for constraint in constraints:
-        add_constraint(solver, constraint)
-
-    width, height = max(map(lambda box: box.x.value + box.width + box.space[2] + space, boxes)), \
-                    max(map(lambda box: box.y.value + box.height + box.space[3] + space, boxes))
-    new_coordinates = OrderedDict({parent: (0, 0, width, height)})
-    for box in boxes:
-        new_coordinates[box.box] = (box.x.value, box.y.value, box.x.value + box.width, box.y.value + box.height)
-    return new_coordinates
+            x = self._center(x_graph, x, 0, lambda child: sizes[child][0], lambda child: spaces[child][0::2])
+
+        width = max(map(lambda child: x[child] + sizes[child][0] + spaces[child][2] + space, children))
+        height = max(map(lambda child: y[child] + sizes[child][1] + spaces[child][3] + space, children))
+        new_coordinates = OrderedDict({parent: (0, 0, width, height)})
+        for child in children:
+            w, h = sizes[child]
+            new_coordinates[child] = (x[child], y[child], x[child] + w, y[child] + h)
+        return new_coordinates
+
+    @staticmethod
+    def _center(graph, minimum, start, size, margins):
+        """
+        Center the boxes between the start of the frame and its end, without violating the constraints :
+        the boxes related by constraints are moved together, as close as possible to their centered positions.
+        :param graph: the graph of the constraints on this axis
+        :param minimum: the minimal positions of the boxes
+        :param start: the start of the frame
+        :param size: function giving the size of a box on this axis
+        :param margins: function giving the additional spaces (before, after) of a box on this axis
+        :return: the dict of the positions
+        """
+        groups = components(graph)
+        # the smallest end of the frame such that the single boxes can be centered
+        end = max(map(lambda box: minimum[box] + size(box) + margins(box)[1] + space, graph.keys()))
+        for group in filter(lambda group: len(group) == 1, groups):
+            box = group[0]
+            end = max(end, 2 * minimum[box] - start + size(box) + margins(box)[0] + margins(box)[1])
+        position = {}
+        for group in groups:
+            shifts = sorted(map(lambda box: (start + end - size(box) - margins(box)[0] - margins(box)[1]) / 2
+                                            - minimum[box], group))
+            shift = max(0, shifts[(len(shifts) - 1) // 2])
+            for box in group:
+                position[box] = minimum[box] + shift
+        return position
+
+
+def components(graph):
+    """
+    :param graph: a dict linking each node to the list of its successors (node, offset, constraint)
+    :return: the list of the connected components of the graph (the direction of the edges is ignored)
+    """
+    neighbours = {node: [] for node in graph.keys()}
+    for node, successors in graph.items():
+        for successor, offset, constraint in successors:
+            neighbours[node].append(successor)
+            neighbours[successor].append(node)
+    groups, visited = [], set()
+    for node in graph.keys():
+        if node not in visited:
+            visited.add(node)
+            group = [node]
+            for member in group:
+                for neighbour in neighbours[member]:
+                    if neighbour not in visited:
+                        visited.add(neighbour)
+                        group.append(neighbour)
+            groups.append(group)
+    return groups
+
+
+def topological_order(graph):
+    """
+    :param graph: a dict linking each node to the list of its successors (node, offset, constraint)
+    :return: the list of the nodes in a topological order (the nodes in a cycle are missing)
+    """
+    in_degree = OrderedDict((node, 0) for node in graph.keys())
+    for successors in graph.values():
+        for successor, offset, constraint in successors:
+            in_degree[successor] += 1
+    order = [node for node, degree in in_degree.items() if degree == 0]
+    for node in order:
+        for successor, offset, constraint in graph[node]:
+            in_degree[successor] -= 1
+            if in_degree[successor] == 0:
+                order.append(successor)
+    return order
+
+
+def find_cycle(graph):
+    """
+    :param graph: a dict linking each node to the list of its successors (node, offset, constraint)
+    :return: the list of the constraints of a cycle in the graph, or an empty list if there is none
+    """
+    ordered = set(topological_order(graph))
+    remaining = [node for node in graph.keys() if node not in ordered]
+    if not remaining:
+        return []
+    # every remaining node has a remaining predecessor : walk backwards until a node repeats
+    predecessor = {}
+    for node in remaining:
+        for successor, offset, constraint in graph[node]:
+            if successor not in ordered:
+                predecessor[successor] = (node, constraint)
+    path, node = [], remaining[0]
+    while node not in path:
+        path.append(node)
+        node = predecessor[node][0]
+    cycle = path[path.index(node):]
+    return [predecessor[node][1] for node in reversed(cycle)]
+
+
+def reachable(graph, source, target):
+    """
+    :return: True if the target can be reached from the source in the graph
+    """
+    visited, stack = {source}, [source]
+    while stack:
+        node = stack.pop()
+        if node == target:
+            return True
+        for successor, offset, constraint in graph[node]:
+            if successor not in visited:
+                visited.add(successor)
+                stack.append(successor)
+    return False
+
+
+def longest_paths(graph, minimum):
+    """
+    Compute the smallest positions satisfying all the difference constraints of an acyclic graph.
+    :param graph: a dict linking each node to the list of its successors (node, offset, constraint)
+    :param minimum: the dict of the minimal position of each node
+    :return: the dict of the positions
+    """
+    position = dict(minimum)
+    for node in topological_order(graph):
+        for successor, offset, constraint in graph[node]:
+            position[successor] = max(position[successor], position[node] + offset)
+    return position
+
+
+def order_pairs(children, constraint_list):
+    """
+    Compute the pairs of children whose order on the axis of the parent has to be constrained.
+    Two children not related by a constraint must keep their order, but a pair is not constrained
+    directly when a child between them is ordered with both : the order follows by transitivity.
+    Without constraints, only the consecutive children are ordered.
+
+    :param children: the children of the parent in their order
+    :param constraint_list: the list of constraints on the children
+    :return: the set of pairs (box1, box2) such that box1 has to be placed before box2
+    """
+    constrained = {}
+    for constraint in constraint_list:
+        constrained.setdefault(constraint.box1, set()).add(constraint.box2)
+        constrained.setdefault(constraint.box2, set()).add(constraint.box1)
+    degree = max(map(len, constrained.values()), default=0)
+
+    pairs = set()
+    for i in range(len(children)):
+        b1 = children[i]
+        related = constrained.get(b1, ())
+        followers = []  # the following children ordered after b1
+        for j in range(i + 1, len(children)):
+            b2 = children[j]
+            if b2 in related:
+                continue
+            if all(b2 in constrained.get(b, ()) for b in followers):
+                pairs.add((b1, b2))
+            followers.append(b2)
+            # b2 cannot be related to all the followers anymore
+            if len(followers) > degree:
+                break
+    return pairs
+
+
+solvers = {'cassowary': CassowarySolver, 'difference': DifferenceSolver}
+
+
+def resolve(parent, dimensions, children, constraint_list):
+    """
+    Resolve a coordinates problem. The coordinates of the children entered in parameter will be computed.
+
+    :param parent: the main box that contains the children entered in parameter
+    :param dimensions: the dict of children's dimensions
+    :param children: the children to dispose in the parent's box
+    :param constraint_list: the list of constraints
+    :return: the dict that contains the coordinates of the children in parameter
+    """
+    return CassowarySolver(parent).resolve(dimensions, children, constraint_list)
@@ -0,0 +1,72 @@
+import constraint_solver
+import tree_index
+from structures.metrics import get_text_metrics
+from collections import OrderedDict
+
+
+def solve(box):
+    """
+    Solve the disposition of every modified Box in the tree of the box in parameter.
+    The boxes are visited once, children first, so that the size of each Box
+    is computed from the already solved sizes of its children.
+    The solution of a Box is stored in the Box itself : it is an OrderedDict linking
+    the Box with (0, 0, width, height) and its children with their coordinates relatively to it.
+    A solution computed with another measure of the texts is solved again, and the coordinates
+    cached in the boxes solved again are dropped.
+
+    :param box: the root of the tree to solve
+    """
+    metrics = get_text_metrics()
+    pending = []
+    stack = [box]
+    while stack:
+        current = stack.pop()
+        # a solved Box has a solved subtree
+        if current._layout is None or current._layout_metrics is not metrics:
+            pending.append(current)
+            stack.extend(current._children)
+    for current in reversed(pending):
+        current._layout = _solve_box(current)
+        current._layout_metrics = metrics
+        current._coordinates = None
+
+
+def _solve_box(box):
+    if not box._children:
+        width, height = box.dimensions
+        return OrderedDict({box: (0, 0, width, height)})
+    dimensions = OrderedDict()
+    for child in box._children:
+        x1, y1, x2, y2 = child._layout[child]
+        dimensions[child] = (x2 - x1, y2 - y1)
+    if box._solver is None:
+        box._solver = _solver_class(box)(box)
+    return box._solver.resolve(dimensions, box._children, box._constraints)
+
+
+def _solver_class(box):
+    while box._solver_class is None and box._parent is not None:
+        box = box._parent
+    return box._solver_class or constraint_solver.CassowarySolver
+
+
+def size(box):
+    """
+    :return: the size (width, height) of the box once its disposition is solved
+    """
+    solve(box)
+    x1, y1, x2, y2 = box._layout[box]
+    return x2 - x1, y2 - y1
+
+
+def place(box):
+    """
+    Solve the dispositions of the Boxes in the box in parameter ; their absolute coordinates
+    are resolved lazily from the offsets relative to their parents.
+
+    :param box: the solved Box to place at (0, 0)
+    :return: the read-only dictionary linking the boxes with their coordinates
+        format : {Box : (x1, y1, x2, y2)} where insert=(x1, y1) and end=(x2, y2)
+    """
+    solve(box)
+    return tree_index.index_of(box).place()
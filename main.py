@@ -3,7 +3,7 @@ import sys
 import svgwriter
 from sismic import io, model
 from structures.box_elements import RootBox
-from constraint_solver import Constraint
+from constraint_solver import Constraint, InfeasibleConstraintsError
 import readline
 import rlcompleter
 import atexit
@@ -57,9 +57,13 @@ while True:
             box1 = next(filter(lambda x: x.name == instr[1], box.inner_states), None)
             box2 = next(filter(lambda x: x.name == instr[3], box.inner_states), None)
             if box1 is not None and box2 is not None:
-                box.add_constraint(Constraint(box1, instr[2], box2))
-                svgwriter.export(box)
-                print("Constraints : ", box.constraints)
+                try:
+                    box.add_constraint(Constraint(box1, instr[2], box2))
+                except InfeasibleConstraintsError as e:
+                    print(e)
+                else:
+                    svgwriter.export(box)
+                    print("Constraints : ", box.constraints)
             else:
                 print(instr[1] + ' or ' + instr[3] + ' is not in the main Box')
 
@@ -1,5 +1,49 @@
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heapify, heappop, heappush
+
 import structures.box
+import structures.transition
 from structures.box import space, distance, zone
+from structures.crossings import ConflictMatrix
+from structures.snapshot import LayoutSnapshot
+
+
+class SearchBudget:
+    """
+    Budget of the anytime search of the routes of the transitions : the transitions with the most conflicts
+    are improved first, round after round, until no route is improved or the budget is spent.
+
+    :param seconds: (optional) the wall-clock time allowed to the search
+    :param evaluations: (optional) the maximum number of candidate routes evaluated
+    :param rounds: the maximum number of improvement rounds
+    """
+
+    def __init__(self, seconds: float = None, evaluations: int = None, rounds: int = 1):
+        self.seconds = seconds
+        self.evaluations = evaluations
+        self.rounds = rounds
+
+    def split(self, sizes):
+        """
+        Share the budget between independent searches : the evaluations are split in proportion to the sizes,
+        while each search gets the whole time and all the rounds.
+
+        :param sizes: the number of transitions of each search
+        :return: the list of the budgets of the searches
+        """
+        if self.evaluations is None:
+            return [self] * len(sizes)
+        total = sum(sizes)
+        shares = [self.evaluations * size // total for size in sizes]
+        for k in range(self.evaluations - sum(shares)):
+            shares[k] += 1
+        return [SearchBudget(self.seconds, share, self.rounds) for share in shares]
+
+    def __repr__(self):
+        return 'SearchBudget(seconds=' + repr(self.seconds) + ', evaluations=' + repr(self.evaluations) + \
+               ', rounds=' + repr(self.rounds) + ')'
 
 
 def compute_attraction_points(box, coordinates):
@@ -10,12 +54,243 @@ def compute_attraction_points(box, coordinates):
     return (mid_x, y1 + space / 2), (x2 - space / 2, mid_y), (mid_x, y2 - space / 2), (x1 + space / 2, mid_y)
 
 
-def transitions_local_search(transitions, coordinates):
-    nb_conflicts = lambda transition: len(transition.conflicts_with_boxes(coordinates)) + \
-                                      len(transition.conflicts_with_transitions(transitions))
+def search_region(transition, snapshot):
+    """
+    The points of the routes the local search can give to a transition are built from the coordinates of its source,
+    of its target and of the attraction points of their lower common ancestor : they stay in the rectangle
+    that bounds these points and the current route.
+
+    :return: the rectangle (x1, y1, x2, y2) of the routes of the transition
+    """
+    points = [point for segment in transition.segments for point in (segment.p1, segment.p2)]
+    if transition.source != transition.target:
+        points += compute_attraction_points(
+            structures.box.lower_common_ancestor(transition.source, transition.target), snapshot)
+        for box in (transition.source, transition.target):
+            x1, y1, x2, y2 = snapshot[box]
+            points += [(x1, y1), (x2, y2)]
+    xs, ys = [x for x, y in points], [y for x, y in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def conflict_components(transitions, snapshot, conflicts: ConflictMatrix):
+    """
+    Split the transitions the local search can move into the connected components of the graph of their
+    potential conflicts. A transition can move if it is in conflict, or if its route is in the search region
+    of a transition that can move. A transition that cannot move is only an obstacle, kept in the components
+    whose search regions overlap its route, and otherwise left out.
+    The routes in the search region of a transition are found in a uniform grid, and each route is found once.
+
+    :return: the list of the components, lists of indices in increasing order, sorted by their first index
+    """
+    routes = []
+    for transition in transitions:
+        points = [point for segment in transition.segments for point in (segment.p1, segment.p2)]
+        xs, ys = [x for x, y in points], [y for x, y in points]
+        routes.append((min(xs), min(ys), max(xs), max(ys)))
+
+    def overlap(region1, region2):
+        return region1[0] <= region2[2] and region2[0] <= region1[2] and \
+               region1[1] <= region2[3] and region2[1] <= region1[3]
+
+    # the routes of the transitions that can move, in the cells of a uniform grid, until they are found
+    cell = 5 * space
+
+    def cells_of(x1, y1, x2, y2):
+        return [(column, row) for column in range(math.floor(x1 / cell), math.floor(x2 / cell) + 1)
+                for row in range(math.floor(y1 / cell), math.floor(y2 / cell) + 1)]
+
+    cells = {}
+    for j, transition in enumerate(transitions):
+        if transition.source != transition.target:
+            for key in cells_of(*routes[j]):
+                cells.setdefault(key, []).append(j)
+
+    regions = list(routes)
+    movable = set()
+    pending = [i for i, transition in enumerate(transitions)
+               if transition.source != transition.target and conflicts.count(transition)]
+    found = set(pending)
+    while pending:
+        i = pending.pop()
+        movable.add(i)
+        regions[i] = search_region(transitions[i], snapshot)
+        for key in cells_of(*regions[i]):
+            if key in cells:
+                for j in cells[key]:
+                    if j not in found and overlap(routes[j], regions[i]):
+                        found.add(j)
+                        pending.append(j)
+                cells[key] = [j for j in cells[key] if j not in found]
+
+    parent = list(range(len(transitions)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # sweep the regions from left to right
+    active = []
+    for i in sorted(range(len(transitions)), key=lambda i: regions[i][0]):
+        active = [j for j in active if regions[j][2] >= regions[i][0]]
+        for j in active:
+            if (i in movable or j in movable) and overlap(regions[i], regions[j]):
+                parent[find(i)] = find(j)
+        active.append(i)
+
+    components = {}
+    for i in range(len(transitions)):
+        components.setdefault(find(i), []).append(i)
+    return sorted(component for component in components.values() if movable.intersection(component))
+
+
+class _PlainBox:
+    """
+    Stand-in of a Box in a worker process, with what the local search reads of it.
+    """
+    __slots__ = ('header', 'ancestors')
+
+    def __init__(self, header, ancestors):
+        self.header = header
+        self.ancestors = ancestors
+
+
+def _search_component(boxes, transitions, budget):
+    """
+    Local search of a component of transitions in a worker process, from plain data.
+
+    :param boxes: list of (header, parent, coordinates) of the boxes around the component, the parents first
+    :param transitions: list of (source, target, start, end, polyline) of the transitions of the component
+    :param budget: the budget of the search, or None
+    :return: the list of the polylines of the transitions
+    """
+    plain_boxes = []
+    for header, parent, coordinates in boxes:
+        ancestors = [] if parent < 0 else [plain_boxes[parent]] + plain_boxes[parent].ancestors
+        plain_boxes.append(_PlainBox(header, ancestors))
+    snapshot = LayoutSnapshot({box: coordinates for box, (header, parent, coordinates) in zip(plain_boxes, boxes)})
+    plain_transitions = []
+    for source, target, start, end, polyline in transitions:
+        transition = structures.transition.Transition(plain_boxes[source], plain_boxes[target])
+        transition.update_coordinates(start, end)
+        transition.polyline = polyline
+        plain_transitions.append(transition)
+    transitions_local_search(plain_transitions, snapshot, budget)
+    return [transition.polyline for transition in plain_transitions]
+
+
+def parallel_local_search(transitions, snapshot, budget: SearchBudget = None, workers: int = None):
+    """
+    Local search of the components of potential conflicts in a pool of processes.
+    Without budget, the routes found are the ones of the search of the whole list. A budget is split between
+    the components (see SearchBudget.split), which then search independently : the routes may differ from
+    the ones of a single search.
+
+    :param transitions: the list of the transitions, whose coordinates are up to date
+    :param snapshot: the layout of the boxes
+    :param budget: (optional) the budget of the anytime search, shared by the components
+    :param workers: the maximum number of processes, the number of processors if None
+    """
+    components = conflict_components(transitions, snapshot, ConflictMatrix(transitions, snapshot))
+    if len(components) <= 1:
+        transitions_local_search(transitions, snapshot, budget)
+        return
+
+    tasks = []
+    for component in components:
+        selected = set()
+        for i in component:
+            selected.update(snapshot.overlapping(*search_region(transitions[i], snapshot)))
+            for box in (transitions[i].source, transitions[i].target):
+                selected.update([box] + box.ancestors)
+        ids = {}
+        for box in snapshot:
+            if box in selected:
+                ids[box] = len(ids)
+        boxes = [(box.header, ids[box.parent] if box.parent in ids else -1, snapshot[box]) for box in ids]
+        tasks.append((boxes, [(ids[transitions[i].source], ids[transitions[i].target]) + transitions[i].coordinates +
+                              (transitions[i].polyline,) for i in component]))
+
+    budgets = [None] * len(components) if budget is None else budget.split([len(c) for c in components])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_search_component, boxes, plain_transitions, component_budget)
+                   for (boxes, plain_transitions), component_budget in zip(tasks, budgets)]
+        # the routes are merged in the order of the components
+        for component, future in zip(components, futures):
+            for i, polyline in zip(component, future.result()):
+                transitions[i].polyline = polyline
+
+
+def transitions_local_search(transitions, snapshot, budget: SearchBudget = None, workers: int = 1):
+    """
+    Replace the routes of the transitions in conflict with boxes or other transitions by better ones.
+    Without budget, each transition is improved once, in the order of the list.
+
+    :param transitions: the list of the transitions, whose coordinates are up to date
+    :param snapshot: the layout of the boxes
+    :param budget: (optional) the budget of the anytime search ; the best routing found is kept
+    :param workers: the number of processes searching the independent components of conflicts,
+                    the number of processors if None
+    """
+    if workers != 1:
+        parallel_local_search(transitions, snapshot, budget, workers)
+        return
+    conflicts = ConflictMatrix(transitions, snapshot)
+    evaluations = 0
+    deadline = None
+    if budget is not None and budget.seconds is not None:
+        deadline = time.perf_counter() + budget.seconds
+
+    def exhausted():
+        if budget is None:
+            return False
+        return (budget.evaluations is not None and evaluations >= budget.evaluations) or \
+               (deadline is not None and time.perf_counter() >= deadline)
+
+    def nb_conflicts(transition):
+        return conflicts.count(transition)
+
+    def total_conflicts():
+        return sum(conflicts.count(transition) for transition in transitions)
+
+    def schedule():
+        if budget is None:
+            yield from transitions
+            return
+        best, best_polylines = total_conflicts(), [transition.polyline for transition in transitions]
+        for _ in range(budget.rounds):
+            improved = False
+            # the priorities are refreshed lazily, when a transition reaches the head of the queue
+            queue = [(-nb_conflicts(transition), i) for i, transition in enumerate(transitions)]
+            heapify(queue)
+            while queue and not exhausted():
+                priority, i = heappop(queue)
+                transition = transitions[i]
+                count = nb_conflicts(transition)
+                if count != -priority:
+                    heappush(queue, (-count, i))
+                    continue
+                if count == 0:
+                    # the other entries may have gained conflicts since they were pushed
+                    continue
+                yield transition
+                improved = improved or nb_conflicts(transition) < count
+            if total_conflicts() < best:
+                best, best_polylines = total_conflicts(), [transition.polyline for transition in transitions]
+            if not improved or exhausted():
+                break
+        if total_conflicts() > best:
+            for transition, polyline in zip(transitions, best_polylines):
+                transition.polyline = polyline
 
     def finalization_horizontal(points, transition):
-        x1, y1, x2, y2 = coordinates[transition.target]
+        nonlocal evaluations
+        if exhausted():
+            return
+        evaluations += 1
+        x1, y1, x2, y2 = snapshot[transition.target]
         mid = (x1 + x2) / 2
         a1, a2 = points[-1]
         b1, b2 = min([(mid, y1), (mid, y2)], key=lambda x: distance(points[-1], x))
@@ -26,9 +301,14 @@ def transitions_local_search(transitions, coordinates):
         transition.polyline = points
         if nb_conflicts(t) > nb_conflicts(transition):
             t.polyline = points
+            conflicts.update(t)
 
     def finalization_vertical(points, transition):
-        x1, y1, x2, y2 = coordinates[transition.target]
+        nonlocal evaluations
+        if exhausted():
+            return
+        evaluations += 1
+        x1, y1, x2, y2 = snapshot[transition.target]
         mid = (y1 + y2) / 2
         a1, a2 = points[-1]
         b1, b2 = min([(x1, mid), (x2, mid)], key=lambda x: distance(points[-1], x))
@@ -39,17 +319,18 @@ def transitions_local_search(transitions, coordinates):
         transition.polyline = points
         if nb_conflicts(t) > nb_conflicts(transition):
             t.polyline = points
+            conflicts.update(t)
 
-    for t in transitions:
-        if (t.conflicts_with_transitions(transitions) \
-                    or t.conflicts_with_boxes(coordinates)) \
+    for t in schedule():
+        if (conflicts.crossings(t) \
+                    or conflicts.boxes(t)) \
                 and t.source != t.target:
             lower_common_ancestor = structures.box.lower_common_ancestor(t.source, t.target)
-            n, e, s, w = compute_attraction_points(lower_common_ancestor, coordinates)
+            n, e, s, w = compute_attraction_points(lower_common_ancestor, snapshot)
             transition = t.copy()
 
-            if zone(t.source, t.target, coordinates) == 'west':
-                x1, y1, x2, y2 = coordinates[t.source]
+            if zone(t.source, t.target, snapshot) == 'west':
+                x1, y1, x2, y2 = snapshot[t.source]
 
                 if x1 < n[0]:
                     for points in [[n], [s], [w]]:
@@ -106,8 +387,8 @@ def transitions_local_search(transitions, coordinates):
                             points += [s]
                         finalization_horizontal(points, transition)
 
-            elif zone(transition.source, transition.target, coordinates) == 'east':
-                x1, y1, x2, y2 = coordinates[transition.source]
+            elif zone(transition.source, transition.target, snapshot) == 'east':
+                x1, y1, x2, y2 = snapshot[transition.source]
 
                 if x1 > n[0]:
                     for points in [[n], [s], [e]]:
@@ -163,8 +444,8 @@ def transitions_local_search(transitions, coordinates):
                             points += [s]
                         finalization_horizontal(points, transition)
 
-            elif zone(transition.source, transition.target, coordinates) == 'north':
-                x1, y1, x2, y2 = coordinates[transition.source]
+            elif zone(transition.source, transition.target, snapshot) == 'north':
+                x1, y1, x2, y2 = snapshot[transition.source]
 
                 if y1 < w[1]:
                     for points in [[n], [w], [e]]:
@@ -221,7 +502,7 @@ def transitions_local_search(transitions, coordinates):
                         finalization_vertical(points, transition)
 
             else:
-                x1, y1, x2, y2 = coordinates[transition.source]
+                x1, y1, x2, y2 = snapshot[transition.source]
 
                 if y1 > w[1]:
                     for points in [[s], [w], [e]]:
@@ -0,0 +1,267 @@
+from bisect import bisect_left, bisect_right
+from heapq import heappop, heappush
+
+import structures.box
+from structures.box import space
+from structures.crossings import ConflictMatrix
+from structures.segment import Segment
+
+# the costs of a bend and of a crossing with another transition, in length of route
+bend_penalty = 4 * space
+crossing_penalty = 10 * space
+
+
+def ports(rectangle):
+    """
+    :return: the middles of the sides of the rectangle, with the direction leaving the rectangle from each of them
+    """
+    x1, y1, x2, y2 = rectangle
+    return [(((x1 + x2) / 2, y1), (0, -1)), ((x2, (y1 + y2) / 2), (1, 0)),
+            (((x1 + x2) / 2, y2), (0, 1)), ((x1, (y1 + y2) / 2), (-1, 0))]
+
+
+def merged_intervals(intervals):
+    """
+    :return: the union of the closed intervals (a, b), as a sorted list of disjoint intervals
+    """
+    merged = []
+    for a, b in sorted(intervals):
+        if merged and a <= merged[-1][1]:
+            merged[-1] = merged[-1][0], max(merged[-1][1], b)
+        else:
+            merged.append((a, b))
+    return merged
+
+
+class VisibilityGraph:
+    """
+    Sparse orthogonal visibility graph between a source and a target box : the nodes are the crossings of the
+    horizontal and vertical lines that run along the obstacles, at a distance space / 2, and through the middles
+    of the sides of the source and the target. Two consecutive nodes of a line are linked if the segment between
+    them touches no obstacle. The routes leave the source and reach the target by the middle of one of their sides.
+
+    :param area: the rectangle (x1, y1, x2, y2) in which the routes stay
+    :param obstacles: the rectangles the routes must not touch
+    :param source: the rectangle of the source
+    :param target: the rectangle of the target
+    """
+
+    def __init__(self, area, obstacles, source, target):
+        margin = space / 2
+        self.source_ports, self.target_ports = ports(source), ports(target)
+        xs, ys = {area[0] + margin, area[2] - margin}, {area[1] + margin, area[3] - margin}
+        for x1, y1, x2, y2 in obstacles + [source, target]:
+            xs.update((x1 - margin, x2 + margin))
+            ys.update((y1 - margin, y2 + margin))
+        for (x, y), direction in self.source_ports + self.target_ports:
+            xs.add(x)
+            ys.add(y)
+        xs = sorted(x for x in xs if area[0] < x < area[2])
+        ys = sorted(y for y in ys if area[1] < y < area[3])
+        port_points = {point for point, direction in self.source_ports + self.target_ports}
+
+        # horizontal[y] : the intervals of abscissas of the obstacles on the horizontal line y
+        horizontal, vertical = {y: [] for y in ys}, {x: [] for x in xs}
+        for x1, y1, x2, y2 in obstacles:
+            for y in ys[bisect_left(ys, y1):bisect_right(ys, y2)]:
+                horizontal[y].append((x1, x2))
+            for x in xs[bisect_left(xs, x1):bisect_right(xs, x2)]:
+                vertical[x].append((y1, y2))
+        horizontal = {y: merged_intervals(intervals) for y, intervals in horizontal.items()}
+        vertical = {x: merged_intervals(intervals) for x, intervals in vertical.items()}
+
+        def free(value, intervals):
+            i = bisect_right(intervals, (value, float('inf'))) - 1
+            return i < 0 or intervals[i][1] < value
+
+        def inside(point, rectangle):
+            x, y = point
+            return rectangle[0] <= x <= rectangle[2] and rectangle[1] <= y <= rectangle[3]
+
+        self.nodes = [(x, y) for y in ys for x in xs if free(x, horizontal[y]) and
+                      ((not inside((x, y), source) and not inside((x, y), target)) or (x, y) in port_points)]
+        self.ids = {node: i for i, node in enumerate(self.nodes)}
+        # the nodes of each line, sorted along the line (the nodes are created row after row)
+        rows, columns = {y: [] for y in ys}, {x: [] for x in xs}
+        for node in self.nodes:
+            rows[node[1]].append(node)
+            columns[node[0]].append(node)
+        self.edges = [[] for node in self.nodes]  # (neighbour, direction) of each node
+
+        def touches(a, b, rectangle, rectangle_ports):
+            # a segment may only touch the source or the target by leaving it from a port, perpendicularly
+            if not (min(a[0], b[0]) <= rectangle[2] and rectangle[0] <= max(a[0], b[0]) and
+                    min(a[1], b[1]) <= rectangle[3] and rectangle[1] <= max(a[1], b[1])):
+                return False
+            for port, (dx, dy) in rectangle_ports:
+                for p, q in [(a, b), (b, a)]:
+                    if p == port and not inside(q, rectangle) and \
+                            (q[0] - p[0]) * dx + (q[1] - p[1]) * dy > 0:
+                        return False
+            return True
+
+        def link(a, b, intervals, low, high):
+            i = bisect_left(intervals, (low, low))
+            if i < len(intervals) and intervals[i][0] < high:
+                return
+            if touches(a, b, source, self.source_ports) or touches(a, b, target, self.target_ports):
+                return
+            i, j = self.ids[a], self.ids[b]
+            direction = ((b[0] > a[0]) - (b[0] < a[0]), (b[1] > a[1]) - (b[1] < a[1]))
+            self.edges[i].append((j, direction))
+            self.edges[j].append((i, (-direction[0], -direction[1])))
+
+        for y, line in rows.items():
+            for a, b in zip(line, line[1:]):
+                link(a, b, horizontal[y], a[0], b[0])
+        for x, line in columns.items():
+            for a, b in zip(line, line[1:]):
+                link(a, b, vertical[x], a[1], b[1])
+
+    def shortest_route(self, crossings=None):
+        """
+        A* search of the route with the lowest cost : its length, plus bend_penalty for each bend
+        and crossing_penalty for each transition crossed by each of its segments.
+
+        :param crossings: (optional) function giving the number of transitions crossed by the segment (a, b)
+        :return: the list of the points of the route, from the source to the target, or None if there is no route
+        """
+        goals = {self.ids[point] for point, direction in self.target_ports if point in self.ids}
+        if not goals:
+            return None
+        goal_points = [self.nodes[goal] for goal in goals]
+
+        def estimate(i):
+            x, y = self.nodes[i]
+            return min(abs(x - gx) + abs(y - gy) for gx, gy in goal_points)
+
+        queue, costs, previous, counter = [], {}, {}, 0
+        for point, direction in self.source_ports:
+            if point in self.ids:
+                state = (self.ids[point], direction)
+                costs[state] = 0
+                heappush(queue, (estimate(state[0]), counter, state))
+                counter += 1
+        while queue:
+            f, _, state = heappop(queue)
+            i, direction = state
+            cost = costs[state]
+            if f > cost + estimate(i):
+                continue
+            if i in goals:
+                route = [self.nodes[i]]
+                while state in previous:
+                    state = previous[state]
+                    route.append(self.nodes[state[0]])
+                return simplified(route[::-1])
+            for j, edge_direction in self.edges[i]:
+                if edge_direction == (-direction[0], -direction[1]):
+                    continue
+                (x1, y1), (x2, y2) = self.nodes[i], self.nodes[j]
+                new_cost = cost + abs(x2 - x1) + abs(y2 - y1) + (bend_penalty if edge_direction != direction else 0)
+                if crossings is not None:
+                    new_cost += crossing_penalty * crossings(self.nodes[i], self.nodes[j])
+                new_state = (j, edge_direction)
+                if new_cost < costs.get(new_state, float('inf')):
+                    costs[new_state] = new_cost
+                    previous[new_state] = state
+                    heappush(queue, (new_cost + estimate(j), counter, new_state))
+                    counter += 1
+        return None
+
+
+def simplified(route):
+    """
+    :return: the route without its points in the middle of straight lines
+    """
+    points = [route[0]]
+    for point, following in zip(route[1:], route[2:]):
+        if not (points[-1][0] == point[0] == following[0] or points[-1][1] == point[1] == following[1]):
+            points.append(point)
+    return points + [route[-1]] if len(route) > 1 else points
+
+
+class VisibilityRouter:
+    """
+    Router of the transitions between the boxes of a layout, through visibility graphs.
+    The route between two boxes stays in their lower common ancestor, under its header, and avoids
+    the boxes that are not an ancestor of the source or of the target. The visibility graph of a pair of boxes
+    is built once, as well as their route when the other transitions are ignored : this route is reused as long as
+    it crosses no transition, since no route can then cost less. Only the other transitions search their route again.
+
+    :param snapshot: the layout of the boxes
+    """
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+        self._graphs = {}
+        self._routes = {}
+
+    def route(self, source, target, crossings=None):
+        """
+        :param source: the source box
+        :param target: the target box
+        :param crossings: (optional) function giving the number of transitions crossed by the segment (a, b)
+        :return: the list of the points of the route from the source to the target, or None if there is no route
+        """
+        if (source, target) not in self._graphs:
+            self._graphs[source, target] = self._graph(source, target)
+        graph = self._graphs[source, target]
+        if graph is None:
+            return None
+        if (source, target) not in self._routes:
+            self._routes[source, target] = graph.shortest_route()
+        route = self._routes[source, target]
+        if crossings is None or route is None or not any(crossings(a, b) for a, b in zip(route, route[1:])):
+            return route
+        return graph.shortest_route(crossings)
+
+    def _graph(self, source, target):
+        if source == target or source in target.ancestors or target in source.ancestors:
+            return None
+        lower_common_ancestor = structures.box.lower_common_ancestor(source, target)
+        # the boxes crossed by the way from the lower common ancestor to the source and to the target
+        chain = {lower_common_ancestor, source, target}
+        for box in (source, target):
+            chain.update(box.ancestors[:box.ancestors.index(lower_common_ancestor)])
+        obstacles = [self._snapshot[child] for box in chain if box not in (source, target)
+                     for child in box.children if child not in chain]
+        x1, y1, x2, y2 = self._snapshot[lower_common_ancestor]
+        area = x1, y1 + lower_common_ancestor.header, x2, y2
+        return VisibilityGraph(area, obstacles, self._snapshot[source], self._snapshot[target])
+
+
+def visibility_routing(transitions, snapshot):
+    """
+    Replace the route of each transition in conflict with boxes or other transitions by the route
+    found in the visibility graph of its source and its target, when this route has fewer conflicts.
+    The routes avoid the current routes of the other transitions.
+
+    :param transitions: the list of the transitions, whose coordinates are up to date
+    :param snapshot: the layout of the boxes
+    """
+    conflicts = ConflictMatrix(transitions, snapshot)
+    router = VisibilityRouter(snapshot)
+
+    def nb_conflicts(transition, current):
+        return len(conflicts.boxes(transition)) + \
+               len([other for other in conflicts.crossings(transition) if other is not current])
+
+    for transition in transitions:
+        if transition.source != transition.target and conflicts.count(transition):
+            crossed = {}
+
+            def crossings(a, b):
+                if (a, b) not in crossed:
+                    crossed[a, b] = len([other for other in conflicts.crossed([Segment(a, b)])
+                                         if other is not transition])
+                return crossed[a, b]
+
+            route = router.route(transition.source, transition.target, crossings)
+            if route is None:
+                continue
+            candidate = transition.copy()
+            candidate.polyline = route
+            if nb_conflicts(candidate, transition) < nb_conflicts(transition, transition):
+                transition.polyline = route
+                conflicts.update(transition)
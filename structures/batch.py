@@ -0,0 +1,107 @@
+import math
+from structures.segment import Segment, segments_intersect
+
+try:
+    import numpy
+except ImportError:  # the candidates are compared one by one with the segments of their cells
+    numpy = None
+
+# the number of pairs (candidate, segment of a covered cell) from which a count is vectorized with NumPy :
+# below it, the overhead of the arrays is greater than the cost of the comparisons
+vectorized_pairs = 256
+
+
+class SegmentGrid:
+    """
+    Horizontal and vertical segments indexed by the cells of a uniform grid, to be compared with the few sides
+    of a text : only the segments registered in the cells covered by a candidate segment are compared with it.
+    The other segments are all compared with intersect, which can find an intersection out of their bounding box.
+    When NumPy is installed and the cells covered by the candidates hold at least vectorized_pairs pairs
+    to compare, the candidates are compared with their segments at once.
+
+    :param segments: (optional) the segments to index
+    :param cell: the side of the cells of the grid
+    """
+
+    def __init__(self, segments=(), cell: float = 100):
+        self._cell = cell
+        self._bounds = []  # (x_min, y_min, x_max, y_max) of the horizontal and vertical segments
+        self._slanted = []  # the other segments
+        self._cells = {}  # (column, row) -> the ids of the segments whose bounds cover the cell
+        self._columns = None  # the bounds of the horizontal and vertical segments, as an array
+        self.extend(segments)
+
+    def _cells_of(self, x_min, y_min, x_max, y_max):
+        columns = range(math.floor(x_min / self._cell), math.floor(x_max / self._cell) + 1)
+        rows = range(math.floor(y_min / self._cell), math.floor(y_max / self._cell) + 1)
+        return [(column, row) for column in columns for row in rows]
+
+    def extend(self, segments):
+        """
+        Index new segments.
+        """
+        for segment in segments:
+            (x1, y1), (x2, y2) = segment.p1, segment.p2
+            if x1 == x2 or y1 == y2:
+                bounds = min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+                for cell in self._cells_of(*bounds):
+                    self._cells.setdefault(cell, []).append(len(self._bounds))
+                self._bounds.append(bounds)
+            else:
+                self._slanted.append(segment)
+        self._columns = None
+
+    def __len__(self):
+        return len(self._bounds) + len(self._slanted)
+
+    def count(self, candidates, limit=None):
+        """
+        :param candidates: a list of horizontal or vertical segments (x1, y1, x2, y2)
+        :param limit: (optional) the counting stops as soon as the number of pairs exceeds the limit
+        :return: the number of pairs (candidate, indexed segment) that intersect,
+                 or a number greater than the limit
+        """
+        counter = 0
+        if self._bounds:
+            # the segments of the cells covered by each candidate
+            found = []
+            for x1, y1, x2, y2 in candidates:
+                ids = set()
+                for cell in self._cells_of(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)):
+                    ids.update(self._cells.get(cell, ()))
+                found.append(ids)
+            if numpy is not None and sum(map(len, found)) >= vectorized_pairs:
+                counter = self._count_vectorized(candidates, found)
+            else:
+                for (x1, y1, x2, y2), ids in zip(candidates, found):
+                    x_min, y_min, x_max, y_max = min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+                    for k in ids:
+                        x3, y3, x4, y4 = self._bounds[k]
+                        if x3 <= x_max and x_min <= x4 and y3 <= y_max and y_min <= y4:
+                            counter += 1
+                            if limit is not None and counter > limit:
+                                return counter
+            if limit is not None and counter > limit:
+                return limit + 1
+        for x1, y1, x2, y2 in candidates:
+            for segment in self._slanted:
+                if segments_intersect(Segment((x1, y1), (x2, y2)), segment):
+                    counter += 1
+                    if limit is not None and counter > limit:
+                        return counter
+        return counter
+
+    def _count_vectorized(self, candidates, found):
+        # Two segments whose bounds overlap share a cell : the segments of the cells covered by a candidate
+        # can be compared with all the candidates.
+        ids = set().union(*found)
+        if self._columns is None:
+            self._columns = numpy.array(self._bounds, dtype=float)
+        rows = self._columns[numpy.fromiter(ids, dtype=int, count=len(ids))]
+        candidates = numpy.array(candidates, dtype=float)
+        c_x_min = numpy.minimum(candidates[:, 0], candidates[:, 2])[:, None]
+        c_y_min = numpy.minimum(candidates[:, 1], candidates[:, 3])[:, None]
+        c_x_max = numpy.maximum(candidates[:, 0], candidates[:, 2])[:, None]
+        c_y_max = numpy.maximum(candidates[:, 1], candidates[:, 3])[:, None]
+        return int(numpy.count_nonzero((rows[:, 0] <= c_x_max) & (c_x_min <= rows[:, 2]) &
+                                       (rows[:, 1] <= c_y_max) & (c_y_min <= rows[:, 3])))
@@ -1,10 +1,12 @@
-import constraint_solver
-from constraint_solver import Constraint
+import layout
+from constraint_solver import Constraint, ConstraintStore
 import math
 from typing import Dict, Tuple
-from collections import OrderedDict
+from structures.metrics import text_width, get_text_metrics
 
-char_width, char_height, space, radius = 12, 20, 20, 20
+char_height, space, radius = 20, 20, 20
+# the zone written left to the name of a box with parallel states, and the prefix of its entry and exit texts
+parallel_tag, entry_tag = '<<parallel>> ', 'entry / '
 
 
 class Box:
@@ -27,9 +29,16 @@ class Box:
         self._exit = ''  # type: str
         self._parent = None  # type: Box
         self._shape = 'rectangle'  # type: str
-        self._constraints = set()  # type: set[Constraint]
+        self._constraints = ConstraintStore()  # type: ConstraintStore
         self._additional_space = 0, 0, 0, 0
         self._width, self._height = -1, -1
+        self._layout = None  # the disposition of the Box and of its children, solved by layout.solve
+        self._layout_metrics = None  # the measure of the texts when the layout was solved
+        self._extent = None  # the layout and the bounds of the descendants relatively to the Box
+        self._coordinates = None  # type: tree_index.Coordinates
+        self._index = None  # type: tree_index.TreeIndex
+        self._solver = None  # the solver of the constraints on the children, kept between the layouts
+        self._solver_class = None  # the class of the solvers in this Box, inherited from the parent if None
 
     @property
     def dimensions(self):
@@ -40,31 +49,62 @@ class Box:
         # leaf box
         if not self._children:
             if self._parallel_states:
-                p_len = 14 * char_width
+                p_len = text_width(parallel_tag, 'italic') + text_width(' ')
             else:
                 p_len = 0
             if self.entry != '':
-                entry_len = max(map(lambda x: (8 + len(x)) * char_width, self._entry.split('\n')))
+                entry_len = max(map(lambda x: text_width(entry_tag, 'italic') + text_width(x), self._entry.split('\n')))
             else:
                 entry_len = 0
             if self.exit != '':
-                exit_len = max(map(lambda x: (8 + len(x)) * char_width, self._exit.split('\n')))
+                exit_len = max(map(lambda x: text_width(entry_tag, 'italic') + text_width(x), self._exit.split('\n')))
             else:
                 exit_len = 0
-            return max(p_len + len(self.name) * char_width, entry_len, exit_len) + 2 * space, self.header + 2 * space
+            return max(p_len + text_width(self.name, 'bold'), entry_len, exit_len) + 2 * space, self.header + 2 * space
         else:
-            x1, y1, x2, y2 = self.coordinates[self]
+            x2, y2 = layout.size(self)
             if self._parallel_states:
                 if self.parent.axis == 'horizontal':
-                    y2 = max(map(lambda child: child.coordinates[child][3], self.parent._children))
+                    y2 = max(map(lambda child: layout.size(child)[1], self.parent._children))
                 else:
-                    x2 = max(map(lambda child: child.coordinates[child][2], self.parent._children))
+                    x2 = max(map(lambda child: layout.size(child)[0], self.parent._children))
             return x2, y2
 
     @property
     def additional_space(self):
         return self._additional_space
 
+    @additional_space.setter
+    def additional_space(self, additional_space):
+        """
+        Set the space reserved around this Box for the texts of its transitions.
+        :param additional_space: a tuple (left, top, right, bottom)
+        """
+        if additional_space != self._additional_space:
+            self._additional_space = additional_space
+            self.invalidate_layout()
+
+    def invalidate_layout(self):
+        """
+        Drop the cached disposition of this Box and of its ancestors.
+        Must be called each time something that influences the disposition of the boxes is modified.
+        """
+        self._layout, self._coordinates = None, None
+        box = self._parent
+        while box is not None and box._layout is not None:
+            box._layout, box._coordinates = None, None
+            box = box._parent
+
+    def invalidate_index(self):
+        """
+        Drop the tree index of this Box and of its ancestors.
+        Must be called each time a Box or a transition is added to or removed from the tree.
+        """
+        box = self
+        while box is not None:
+            box._index = None
+            box = box._parent
+
     def name_position(self, insert=(0, 0)):
         """
         gives the insert coordinates of the name following the insert coordinates of the Box (given in parameter)
@@ -74,9 +114,10 @@ class Box:
         w = x + self.width / 2
         h = y + space + char_height
         if self._parallel_states:
-            w -= (len(self.name) * char_width + 13 * char_width) / 2  # for the <<parallel>> zone left to the name
+            # for the <<parallel>> zone left to the name
+            w -= (text_width(self.name, 'bold') + text_width(parallel_tag, 'italic')) / 2
         else:
-            w -= (len(self.name) * char_width) / 2
+            w -= text_width(self.name, 'bold') / 2
         return w, h
 
     def entry_position(self, insert=(0, 0)):
@@ -107,32 +148,15 @@ class Box:
         Computes the coordinates of all the Boxes in this Box and returns a dict
         whose key is a Box and the value is its coordinates.
 
-        :return: the dictionary linking the boxes (in this box) with their coordinates
+        The result is cached until the Box or one of its descendants is modified,
+        or the measure of the texts is changed.
+
+        :return: the read-only dictionary linking the boxes (in this box) with their coordinates
             format : {Box : (x1, y1, x2, y2)} where insert=(x1, y1) and end=(x2, y2)
         """
-        if not self._children:
-            return OrderedDict({self: (0, 0, self.width, self.height)})
-        else:
-            coordinates = OrderedDict()
-            dimensions = OrderedDict()
-            for child in self.children:
-                coordinates.update(child.coordinates)
-                x1, y1, x2, y2 = coordinates[child]
-                dimensions[child] = (x2 - x1, y2 - y1)
-
-            new_coordinates = constraint_solver.resolve(self, dimensions, self._children, self._constraints)
-
-            def update_coordinates(box1, box2):
-                x1, y1, x2, y2 = new_coordinates[box1]
-                for child in box2.children:
-                    x3, y3, x4, y4 = coordinates[child]
-                    new_coordinates[child] = (x1 + x3, y1 + y3, x1 + x4, y1 + y4)
-                    update_coordinates(box, child)
-
-            for box in self.children:
-                update_coordinates(box, box)
-
-            return new_coordinates
+        if self._coordinates is None or self._layout_metrics is not get_text_metrics():
+            self._coordinates = layout.place(self)
+        return self._coordinates
 
     def move_to(self, direction, box):
         """
@@ -214,6 +238,8 @@ class Box:
                     container.add_child(box)
                     container.add_child(self)
                     parent.add_child(container, index=i_box)
+            parent.invalidate_index()
+            parent.invalidate_layout()
             smooth(lower_common_ancestor(self, box))
         else:
             ancestors_box1 = [self] + self.ancestors
@@ -227,21 +253,21 @@ class Box:
         Add the constraint in the right Box.
         If the parent of the two Boxes of the constraint is self, the constraint is added to self.
         Otherwise, find the common ancestor and add the constraint in this ancestor.
+        A constraint opposite to a previous one cancels it.
+
+        :raise InfeasibleConstraintsError: if the constraint closes a cycle of constraints
+            (e.g., a north of b, b north of c and c north of a) ; it is not added.
         """
         if constraint.box1.parent == constraint.box2.parent == self:
             # contradiction checking
-            opposite = {'north': 'south', 'south': 'north', 'east': 'west', 'west': 'east'}
-            opposite_constraints = list(
-                filter(lambda c: (c.box1 == constraint.box1 and c.box2 == constraint.box2 \
-                                  and opposite[c.direction] == constraint.direction) \
-                                 or (c.box1 == constraint.box2 and c.box2 == constraint.box1 \
-                                     and c.direction == constraint.direction),
-                       self._constraints))
-            if opposite_constraints:
-                for x in opposite_constraints:
-                    self._constraints.remove(x)
+            opposite_constraint = self._constraints.opposite(constraint)
+            if opposite_constraint is not None:
+                self._constraints.remove(opposite_constraint)
+                self.invalidate_layout()
             else:
-                self._constraints.add(constraint)
+                if constraint not in self._constraints:
+                    self._constraints.add(constraint)
+                    self.invalidate_layout()
                 if len(list(filter(lambda child: child.shape != 'circle', self.children))) == 2 \
                         and constraint.direction in ['north', 'south'] and self.axis == 'horizontal':
                     self.axis = 'vertical'
@@ -290,6 +316,8 @@ class Box:
             else:
                 self._children.append(box)
             box._parent = self
+            self.invalidate_index()
+            self.invalidate_layout()
             if constraint is not None and isinstance(constraint[1], Box):
                 constraint = Constraint(box, constraint[0], constraint[1])
                 self.add_constraint(constraint)
@@ -304,6 +332,8 @@ class Box:
         if box in self.children:
             self._children.remove(box)
             box._parent = None
+            self.invalidate_index()
+            self.invalidate_layout()
             return True
         else:
             return False
@@ -312,6 +342,7 @@ class Box:
         """
         Hide the guard on every transitions related to this box and in this box.
         """
+        self.invalidate_layout()
         for transition in self.transitions:
             transition.hide_guard()
         for child in self.children:
@@ -321,6 +352,7 @@ class Box:
         """
         Hide the action text on every transition related to this box and in this box.
         """
+        self.invalidate_layout()
         for transition in self.transitions:
             transition.hide_action()
         for child in self.children:
@@ -330,6 +362,7 @@ class Box:
         """
         Hide the event text on every transition related to this box and in this box.
         """
+        self.invalidate_layout()
         for transition in self.transitions:
             transition.hide_event()
         for child in self.children:
@@ -339,6 +372,7 @@ class Box:
         """
         Show the guard text previously hidden on every transition related to this box and in this box.
         """
+        self.invalidate_layout()
         for transition in self.transitions:
             transition.show_guard()
         for child in self.children:
@@ -348,6 +382,7 @@ class Box:
         """
         Show the action text previously hidden on every transition related to this box and in this box.
         """
+        self.invalidate_layout()
         for transition in self.transitions:
             transition.show_action()
         for child in self.children:
@@ -357,6 +392,7 @@ class Box:
         """
         Show the event text previously hidden on every transition related to this box and in this box.
         """
+        self.invalidate_layout()
         for transition in self.transitions:
             transition.show_event()
         for child in self.children:
@@ -377,6 +413,7 @@ class Box:
         """
         if transition is not None and transition.source == self:
             self._transitions.append(transition)
+            self.invalidate_index()
             return True
         return False
 
@@ -386,8 +423,9 @@ class Box:
 
     @entry.setter
     def entry(self, entry: str):
-        if entry is not None:
+        if entry is not None and entry != self._entry:
             self._entry = entry
+            self.invalidate_layout()
 
     @property
     def exit(self):
@@ -395,8 +433,9 @@ class Box:
 
     @exit.setter
     def exit(self, exit: str):
-        if exit is not None:
+        if exit is not None and exit != self._exit:
             self._exit = exit
+            self.invalidate_layout()
 
     @property
     def parallel_states(self):
@@ -405,6 +444,7 @@ class Box:
     def add_parallel_state(self, parallel_state):
         if isinstance(parallel_state, Box):
             self._parallel_states.append(parallel_state)
+            self.invalidate_layout()
             return True
         return False
 
@@ -437,10 +477,12 @@ class Box:
         """
         Get the ancestors of this Box.
         """
-        if self.parent is not None:
-            return [self.parent] + self.parent.ancestors
-        else:
-            return []
+        ancestors = []
+        box = self._parent
+        while box is not None:
+            ancestors.append(box)
+            box = box._parent
+        return ancestors
 
     @property
     def shape(self):
@@ -469,8 +511,9 @@ class Box:
         Set the axis of this Box.
         :param axis: axis in {'horizontal' | 'vertical'}
         """
-        if axis == 'horizontal' or axis == 'vertical':
+        if (axis == 'horizontal' or axis == 'vertical') and axis != self._axis:
             self._axis = axis
+            self.invalidate_layout()
 
     @property
     def zone(self):
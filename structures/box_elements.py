@@ -1,5 +1,11 @@
-from structures.box import Box, radius, char_height, char_width, space
-from structures.transition import Transition, update_transitions_coordinates
+from structures.box import Box, radius, char_height, space
+from structures import metrics
+from structures.transition import Transition, update_transitions_coordinates, routers
+from structures.labels import text_placements
+from structures.snapshot import LayoutSnapshot
+from optimization import SearchBudget
+import constraint_solver
+import tree_index
 import sismic
 from sismic.model.elements import CompoundState, OrthogonalState
 
@@ -29,10 +35,29 @@ class RootBox(Box):
     It intends to represent a statechart.
 
     :param statechart: it is an instance of a statechart object from sismic.
+    :param solver: the solver of the constraints on the boxes : 'cassowary' | 'difference'
+    :param search_budget: (optional) the budget of the anytime search of the routes of the transitions,
+                          a single pass of the search if None
+    :param search_workers: the number of processes searching the routes of independent groups of transitions,
+                           the number of processors if None
+    :param router: the engine that improves the routes of the transitions : 'search' (local search of detours)
+                   | 'visibility' (shortest routes in visibility graphs, with few bends)
+    :param text_placement: the placement of the texts of the transitions : 'sequential' (one after the other)
+                           | 'global' (repaired as a whole)
+    :param text_seconds: (optional) the time allowed to the global placement of the texts, no limit if None
     """
 
-    def __init__(self, statechart: sismic.model.Statechart):
+    def __init__(self, statechart: sismic.model.Statechart, solver: str = 'cassowary',
+                 search_budget: SearchBudget = None, search_workers: int = 1, router: str = 'search',
+                 text_placement: str = 'sequential', text_seconds: float = None):
         super().__init__(name=statechart.name, axis='horizontal')
+        self._snapshot = None  # type: LayoutSnapshot
+        self.solver = solver
+        self.search_budget = search_budget
+        self.search_workers = search_workers
+        self.router = router
+        self.text_placement = text_placement
+        self.text_seconds = text_seconds
 
         self._inner_states = [Box(name) for name in statechart.states]
 
@@ -91,32 +116,24 @@ class RootBox(Box):
 
         :return: all the transitions in the statechart.
         """
-
-        def find_transitions(box, transitions=[]):
-            t = []
-            for child in box.children:
-                for transition in child.transitions:
-                    transition.reset_coordinates()
-                t += find_transitions(child, list(child.transitions))
-            return transitions + t
-
-        transitions = find_transitions(self)
+        transitions = tree_index.index_of(self).descendant_transitions(0)
+        for transition in transitions:
+            transition.reset_coordinates()
 
         for box in self._inner_states:
-            box._additional_space = 0, 0, 0, 0
-
-        coordinates = self.coordinates
-        update_transitions_coordinates(transitions, coordinates)
+            box.additional_space = 0, 0, 0, 0
 
+        # the space reserved around a box follows the zones of the boxes laid out with the space reserved so far
+        snapshot = self.snapshot
         for box in self._inner_states:
             x1, y1, x2, y2 = 0, 0, 0, 0
             for transition in box.transitions:
                 source = transition.source
                 target = transition.target
-                text_width = max(len(transition.guard) * char_width, \
-                               len(transition.event) * char_width, \
-                               len(transition.action) * char_width) + space
-                x3, y3, x4, y4 = target._additional_space
+                text_width = max(metrics.text_width(transition.guard), \
+                                 metrics.text_width(transition.event), \
+                                 metrics.text_width(transition.action)) + space
+                x3, y3, x4, y4 = target.additional_space
                 if source == target:
                     if source.zone == 'north' or source.zone == 'west':
                         x1 = max(x1, space + text_width)
@@ -125,7 +142,7 @@ class RootBox(Box):
                         x2 = max(x2, space + text_width)
                         y2 = space
                 else:
-                    zone = self.zone(target, source)
+                    zone = self.zone(target, source, snapshot)
                     if 'west' in zone:
                         if x4 >= text_width:
                             text_width = 0
@@ -138,25 +155,84 @@ class RootBox(Box):
                         y1 = max(y1, char_height)
                     elif 'south' in zone:
                         y2 = max(y2, char_height)
-                source._additional_space = x1, y1, x2, y2
+                source.additional_space = x1, y1, x2, y2
+                snapshot = self.snapshot
 
-        update_transitions_coordinates(transitions, self.coordinates)
+        update_transitions_coordinates(transitions, self.snapshot, self.search_budget, self.search_workers,
+                                       self.router)
         return transitions
 
     @property
-    def constraints(self):
+    def snapshot(self):
         """
-        :return: all the constraints on the Boxes situated in this Root Box.
+        :return: the frozen result of the current layout, computed once per layout
         """
+        coordinates = self.coordinates
+        if self._snapshot is None or self._snapshot.coordinates is not coordinates:
+            self._snapshot = LayoutSnapshot(coordinates)
+        return self._snapshot
 
-        def find_constraints(box, constraints=set()):
-            c = set()
-            for child in box.children:
-                c = c | find_constraints(child, child._constraints)
-            return constraints | c
+    @property
+    def solver(self):
+        """
+        :return: the name of the solver of the constraints on the boxes
+        """
+        return self._solver_name
 
-        constraints = find_constraints(self)
-        return constraints
+    @solver.setter
+    def solver(self, solver: str):
+        """
+        Select the solver of the constraints on the boxes.
+        :param solver: 'cassowary' (reference) | 'difference' (longest paths in the graph of the constraints)
+        """
+        if solver not in constraint_solver.solvers:
+            raise ValueError('unknown solver: ' + repr(solver) + ', expected one of ' +
+                             ', '.join(map(repr, constraint_solver.solvers)))
+        self._solver_class = constraint_solver.solvers[solver]
+        self._solver_name = solver
+        for box in tree_index.index_of(self).boxes:
+            box._solver, box._layout, box._coordinates = None, None, None
+
+    @property
+    def router(self):
+        """
+        :return: the name of the engine that improves the routes of the transitions
+        """
+        return self._router
+
+    @router.setter
+    def router(self, router: str):
+        """
+        Select the engine that improves the routes of the transitions.
+        :param router: 'search' (local search of detours) | 'visibility' (shortest routes in visibility graphs)
+        """
+        if router not in routers:
+            raise ValueError('unknown router: ' + repr(router))
+        self._router = router
+
+    @property
+    def text_placement(self):
+        """
+        :return: the name of the placement of the texts of the transitions
+        """
+        return self._text_placement
+
+    @text_placement.setter
+    def text_placement(self, text_placement: str):
+        """
+        Select the placement of the texts of the transitions.
+        :param text_placement: 'sequential' (one after the other) | 'global' (repaired as a whole)
+        """
+        if text_placement not in text_placements:
+            raise ValueError('unknown text placement: ' + repr(text_placement))
+        self._text_placement = text_placement
+
+    @property
+    def constraints(self):
+        """
+        :return: all the constraints on the Boxes situated in this Root Box.
+        """
+        return {constraint for box in tree_index.index_of(self).boxes for constraint in box._constraints}
 
     @property
     def inner_states(self):
@@ -173,19 +249,19 @@ class RootBox(Box):
         """
         return next(filter(lambda box: box.name == state_name, self._inner_states))
 
-    def zone(self, box1, box2):
+    def zone(self, box1, box2, snapshot: LayoutSnapshot = None):
         """
         Get the zone of the box1 compared to the box2.
         example : if zone(box1, box2) returns ['south', 'east'] it means that box1 is south east of box2.
         :param box1: the first box (must be in the inner boxes)
         :param box2: the second box (must be in the inner boxes)
+        :param snapshot: (optional) the layout in which the zone is computed, the current one by default
         :return: a list containing precisely the zone of the box1 compared to the box2.
         """
-        coordinates = self.coordinates
-        x1, y1, x2, y2 = coordinates[box1]
-        x3, y3, x4, y4 = coordinates[box2]
-        x1, y1 = (x1 + x2) / 2., (y1 + y2) / 2.
-        x2, y2 = (x3 + x4) / 2., (y3 + y4) / 2.
+        if snapshot is None:
+            snapshot = self.snapshot
+        x1, y1 = snapshot.center(box1)
+        x2, y2 = snapshot.center(box2)
         zone = []
         if x1 < x2:
             zone.append('west')
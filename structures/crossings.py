@@ -0,0 +1,257 @@
+import math
+from bisect import bisect_left, bisect_right, insort
+from structures.segment import intersect
+
+
+def sweep_crossings(horizontals, verticals):
+    """
+    Find the pairs of touching segments (borders included) among horizontal and vertical segments,
+    with a vertical line sweeping the plane from left to right.
+    A zero-length segment is a vertical one.
+
+    :param horizontals: list of horizontal segments (y, x1, x2, key) with x1 <= x2
+    :param verticals: list of vertical segments (x, y1, y2, key) with y1 <= y2
+    :return: the set of the pairs (key1, key2) of the keys of two touching segments, with key1 < key2
+    """
+    # all the segments beginning at an abscissa are added before the ones ending there are removed
+    events = [(x1, 0, n) for n, (y, x1, x2, key) in enumerate(horizontals)] + \
+             [(x2, 1, n) for n, (y, x1, x2, key) in enumerate(horizontals)] + \
+             [(x, 0, len(horizontals) + n) for n, (x, y1, y2, key) in enumerate(verticals)] + \
+             [(x, 1, len(horizontals) + n) for n, (x, y1, y2, key) in enumerate(verticals)]
+    events.sort()
+
+    def add(key1, key2):
+        if key1 != key2:
+            pairs.add((min(key1, key2), max(key1, key2)))
+
+    pairs = set()
+    active_horizontals = []  # (y, n) of the horizontal segments crossing the sweep line, sorted
+    active_verticals = []  # the vertical segments on the sweep line
+    for x, removal, n in events:
+        if n < len(horizontals):
+            y, x1, x2, key = horizontals[n]
+            if removal:
+                del active_horizontals[bisect_left(active_horizontals, (y, n))]
+                continue
+            for m in active_verticals:
+                x3, y3, y4, key2 = verticals[m]
+                if y3 <= y <= y4:
+                    add(key, key2)
+            for y3, m in active_horizontals[bisect_left(active_horizontals, (y, -1)):
+                                            bisect_right(active_horizontals, (y, math.inf))]:
+                add(key, horizontals[m][3])
+            insort(active_horizontals, (y, n))
+        else:
+            n -= len(horizontals)
+            x, y1, y2, key = verticals[n]
+            if removal:
+                active_verticals.remove(n)
+                continue
+            for y3, m in active_horizontals[bisect_left(active_horizontals, (y1, -1)):
+                                            bisect_right(active_horizontals, (y2, math.inf))]:
+                add(key, horizontals[m][3])
+            for m in active_verticals:
+                x3, y3, y4, key2 = verticals[m]
+                if y3 <= y2 and y1 <= y4:
+                    add(key, key2)
+            active_verticals.append(n)
+    return pairs
+
+
+def split_segments(segments):
+    """
+    Sort the segments following their orientation.
+
+    :param segments: a list of segments
+    :return: the horizontal segments (y, x1, x2), the vertical segments (x, y1, y2)
+             and the list of the other segments
+    """
+    horizontals, verticals, slanted = [], [], []
+    for segment in segments:
+        (x1, y1), (x2, y2) = segment.p1, segment.p2
+        if x1 == x2:
+            verticals.append((x1, min(y1, y2), max(y1, y2)))
+        elif y1 == y2:
+            horizontals.append((y1, min(x1, x2), max(x1, x2)))
+        else:
+            slanted.append(segment)
+    return horizontals, verticals, slanted
+
+
+class TransitionCrossings:
+    """
+    Index of the crossings between a list of transitions : a transition crosses another one
+    if an intersection is found between two of their segments, as in Transition.conflicts_with_transitions.
+    The crossings between the horizontal and vertical segments are all found at once by a sweep line,
+    then kept up to date each time a modified transition is refreshed ; the other segments
+    are compared with intersect.
+
+    :param transitions: the transitions to index
+    """
+
+    def __init__(self, transitions):
+        self._transitions = list(transitions)
+        self._ids = {transition: i for i, transition in enumerate(self._transitions)}
+        self._points = []  # the points of the segments of each transition, when it was indexed
+        self._horizontals = []  # (y, x1, x2, id) sorted
+        self._verticals = []  # (x, y1, y2, id) sorted
+        self._slanted = {}  # id -> the slanted segments of the transition
+        self._segments = []  # the segments of each transition
+        self._crossings = [set() for transition in self._transitions]  # the ids crossed by each transition
+        for i, transition in enumerate(self._transitions):
+            self._index(i, transition.segments)
+        self._horizontals.sort()
+        self._verticals.sort()
+        for i, j in sweep_crossings(self._horizontals, self._verticals):
+            self._crossings[i].add(j)
+            self._crossings[j].add(i)
+
+    def _index(self, i, segments):
+        horizontals, verticals, slanted = split_segments(segments)
+        self._horizontals.extend(segment + (i,) for segment in horizontals)
+        self._verticals.extend(segment + (i,) for segment in verticals)
+        if slanted:
+            self._slanted[i] = slanted
+        self._segments.append(segments)
+        self._points.append([(segment.p1, segment.p2) for segment in segments])
+
+    def refresh(self, transition):
+        """
+        Update the crossings of an indexed transition whose segments may have changed.
+        """
+        i = self._ids[transition]
+        segments = transition.segments
+        points = [(segment.p1, segment.p2) for segment in segments]
+        if points == self._points[i]:
+            return
+        for horizontal in split_segments(self._segments[i])[0]:
+            del self._horizontals[bisect_left(self._horizontals, horizontal + (i,))]
+        for vertical in split_segments(self._segments[i])[1]:
+            del self._verticals[bisect_left(self._verticals, vertical + (i,))]
+        self._slanted.pop(i, None)
+        for j in self._crossings[i]:
+            self._crossings[j].discard(i)
+
+        horizontals, verticals, slanted = split_segments(segments)
+        self._crossings[i] = self._query(horizontals, verticals) - {i}
+        for j in self._crossings[i]:
+            self._crossings[j].add(i)
+        for horizontal in horizontals:
+            insort(self._horizontals, horizontal + (i,))
+        for vertical in verticals:
+            insort(self._verticals, vertical + (i,))
+        if slanted:
+            self._slanted[i] = slanted
+        self._segments[i], self._points[i] = segments, points
+
+    def _query(self, horizontals, verticals):
+        found = set()
+        for y, x1, x2 in horizontals:
+            for x, y1, y2, j in self._verticals[bisect_left(self._verticals, (x1,)):
+                                                bisect_right(self._verticals, (x2, math.inf))]:
+                if y1 <= y <= y2:
+                    found.add(j)
+            for y3, x3, x4, j in self._horizontals[bisect_left(self._horizontals, (y,)):
+                                                   bisect_right(self._horizontals, (y, math.inf))]:
+                if x3 <= x2 and x1 <= x4:
+                    found.add(j)
+        for x, y1, y2 in verticals:
+            for y, x1, x2, j in self._horizontals[bisect_left(self._horizontals, (y1,)):
+                                                  bisect_right(self._horizontals, (y2, math.inf))]:
+                if x1 <= x <= x2:
+                    found.add(j)
+            for x3, y3, y4, j in self._verticals[bisect_left(self._verticals, (x,)):
+                                                 bisect_right(self._verticals, (x, math.inf))]:
+                if y3 <= y2 and y1 <= y4:
+                    found.add(j)
+        return found
+
+    def crossings(self, transition):
+        """
+        :param transition: an indexed transition (up to date) or any other transition
+        :return: the list of the indexed transitions crossed by the transition in parameter
+                 (except itself), in the order of the index
+        """
+        i = self._ids.get(transition)
+        if i is None:
+            return self.crossed(transition.segments)
+        return self._found(set(self._crossings[i]), self._segments[i], self._slanted.get(i, []), i)
+
+    def crossed(self, segments):
+        """
+        :param segments: the segments of a route
+        :return: the list of the indexed transitions crossed by the route, in the order of the index
+        """
+        horizontals, verticals, slanted = split_segments(segments)
+        return self._found(self._query(horizontals, verticals), segments, slanted, None)
+
+    def _found(self, found, segments, slanted, i):
+        # the segments that are not horizontal or vertical are compared one by one
+        for j in (range(len(self._transitions)) if slanted else list(self._slanted.keys())):
+            if j not in found and j != i and \
+                    self._intersect(segments, self._segments[j], slanted, self._slanted.get(j, [])):
+                found.add(j)
+        return [self._transitions[j] for j in sorted(found) if j != i]
+
+    @staticmethod
+    def _intersect(segments1, segments2, slanted1, slanted2):
+        for segment1 in segments1:
+            for segment2 in segments2:
+                if (segment1 in slanted1 or segment2 in slanted2) and intersect(segment1, segment2):
+                    return True
+        return False
+
+
+class ConflictMatrix:
+    """
+    Conflicts of a list of transitions with each other and with the boxes of a layout, computed once
+    then updated each time the polyline of one of the transitions is replaced.
+    The conflicts of any other transition (a candidate route) are computed against the index,
+    so only its own segments and their neighbours are compared.
+
+    :param transitions: the transitions to index
+    :param snapshot: the layout of the boxes
+    """
+
+    def __init__(self, transitions, snapshot):
+        self._snapshot = snapshot
+        self._crossings = TransitionCrossings(transitions)
+        self._segments = {transition: transition.segments for transition in transitions}
+        self._boxes = {transition: transition.conflicts_with_boxes(snapshot) for transition in transitions}
+
+    def update(self, transition):
+        """
+        Update the conflicts of an indexed transition whose polyline or coordinates may have changed.
+        """
+        segments = transition.segments
+        if segments is not self._segments[transition]:
+            self._crossings.refresh(transition)
+            self._segments[transition] = segments
+            self._boxes[transition] = transition.conflicts_with_boxes(self._snapshot)
+
+    def boxes(self, transition):
+        """
+        :return: the list of the boxes in conflict with the transition
+        """
+        if transition in self._boxes:
+            return self._boxes[transition]
+        return transition.conflicts_with_boxes(self._snapshot)
+
+    def crossings(self, transition):
+        """
+        :return: the list of the indexed transitions crossed by the transition (except itself)
+        """
+        return self._crossings.crossings(transition)
+
+    def crossed(self, segments):
+        """
+        :param segments: the segments of a route
+        :return: the list of the indexed transitions crossed by the route
+        """
+        return self._crossings.crossed(segments)
+
+    def count(self, transition):
+        """
+        :return: the number of boxes and indexed transitions in conflict with the transition
+        """
+        return len(self.boxes(transition)) + len(self.crossings(transition))
@@ -0,0 +1,179 @@
+import math
+import time
+
+from structures.batch import SegmentGrid
+from structures.transition import text_possibilities, text_edges, text_rectangle
+
+# the placements of the texts of the transitions : one after the other, or repaired as a whole
+text_placements = ('sequential', 'global')
+
+
+def edge_conflicts(edges1, edges2):
+    """
+    :return: the number of pairs of horizontal or vertical sides (x1, y1, x2, y2) that touch each other
+    """
+    counter = 0
+    for x1, y1, x2, y2 in edges1:
+        for x3, y3, x4, y4 in edges2:
+            if min(x3, x4) <= max(x1, x2) and min(x1, x2) <= max(x3, x4) and \
+                    min(y3, y4) <= max(y1, y2) and min(y1, y2) <= max(y3, y4):
+                counter += 1
+    return counter
+
+
+class LabelPlacement:
+    """
+    Placement of the texts of all the transitions at once. Every possibility of every text is scored
+    once against the boxes and the transitions, and the possibilities of different texts that overlap
+    are linked in a conflict graph, weighted as in get_text_and_zone.
+    The texts are first placed one after the other, as by get_text_and_zone, then the placement is repaired :
+    each text in conflict moves to its best possibility given the others, while the total cost decreases.
+
+    :param snapshot: the layout of the boxes
+    :param transitions: the list of the transitions, whose coordinates are up to date
+    :param cell: the side of the cells of the grid used to find the overlapping possibilities
+    :param deadline: (optional) the value of time.perf_counter after which the texts of the remaining transitions
+                     only keep their first possibility
+    """
+
+    def __init__(self, snapshot, transitions, cell: float = 100, deadline: float = None):
+        boxes = SegmentGrid(segment for box in snapshot.keys() for segment in snapshot.segments(box))
+        routes = SegmentGrid(segment for transition in transitions for segment in transition.segments)
+        # the intersections between two texts are counted once per transition
+        self.weight = 4 * len(transitions)
+        self.possibilities = []  # the possibilities of the text of each transition
+        self.owner = []  # possibility -> the transition of the possibility
+        self.edges = []  # possibility -> the sides of the possibility
+        self.costs = []  # possibility -> the number of intersections with the boxes and the transitions
+        self.first = []  # transition -> the id of its first possibility
+        # conflicts[p] : the (possibility, number of intersections) of the other texts in conflict with p
+        self.conflicts = []
+        cells = {}
+        for i, transition in enumerate(transitions):
+            self.first.append(len(self.owner))
+            possibilities = text_possibilities(transition)
+            if deadline is not None and time.perf_counter() >= deadline:
+                possibilities = possibilities[:1]
+            self.possibilities.append(possibilities)
+            for possibility in possibilities:
+                p, edges = len(self.owner), text_edges(possibility)
+                self.owner.append(i)
+                self.edges.append(edges)
+                self.costs.append(boxes.count(edges) + routes.count(edges))
+                self.conflicts.append([])
+                x1, y1, x2, y2 = text_rectangle(possibility)
+                candidates = set()
+                for column in range(math.floor(x1 / cell), math.floor(x2 / cell) + 1):
+                    for row in range(math.floor(y1 / cell), math.floor(y2 / cell) + 1):
+                        candidates.update(cells.setdefault((column, row), []))
+                        cells[column, row].append(p)
+                for q in sorted(candidates):
+                    if self.owner[q] != i:
+                        n = edge_conflicts(edges, self.edges[q])
+                        if n:
+                            self.conflicts[p].append((q, n))
+                            self.conflicts[q].append((p, n))
+        self.first.append(len(self.owner))
+
+        self.chosen = [None] * len(transitions)
+        self.loads = [0] * len(self.owner)  # possibility -> the intersections with the chosen texts of the others
+
+    def _cost(self, p):
+        return self.costs[p] + self.weight * self.loads[p]
+
+    def _choose(self, i, p):
+        previous = self.chosen[i]
+        if previous is not None:
+            for q, n in self.conflicts[previous]:
+                self.loads[q] -= n
+        self.chosen[i] = p
+        for q, n in self.conflicts[p]:
+            self.loads[q] += n
+
+    def _best(self, i):
+        # the first possibility of the list in case of a tie
+        return min(range(self.first[i], self.first[i + 1]), key=self._cost)
+
+    @property
+    def cost(self):
+        """
+        :return: the total cost of the chosen possibilities, each intersection between two texts counted once
+        """
+        chosen = [p for p in self.chosen if p is not None]
+        return sum(self.costs[p] for p in chosen) + self.weight * sum(self.loads[p] for p in chosen) // 2
+
+    def greedy(self):
+        """
+        Place the texts one after the other, each one on its best possibility given the texts already placed.
+        """
+        for i in range(len(self.chosen)):
+            self._choose(i, self._best(i))
+
+    def repair(self, deadline: float = None, rounds: int = 100):
+        """
+        Move the texts in conflict to better possibilities, round after round, until no text moves.
+        A text moves alone to its best possibility, or to another possibility from which the texts
+        it overlaps move away to their best ones, if the total cost decreases.
+
+        :param deadline: (optional) the value of time.perf_counter at which the repair stops
+        :param rounds: the maximum number of rounds
+        """
+        for _ in range(rounds):
+            moved = False
+            for i in range(len(self.chosen)):
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return
+                if self._cost(self.chosen[i]) == 0:
+                    continue
+                best = self._best(i)
+                if self._cost(best) < self._cost(self.chosen[i]):
+                    self._choose(i, best)
+                    moved = True
+                elif self._push(i):
+                    moved = True
+            if not moved:
+                return
+
+    def _push(self, i):
+        # move the text i to each possibility with conflicts, then the texts it overlaps to their best possibility
+        current = self.cost
+        for p in range(self.first[i], self.first[i + 1]):
+            if p == self.chosen[i] or self.loads[p] == 0:
+                continue
+            previous = list(self.chosen)
+            self._choose(i, p)
+            for j in sorted({self.owner[q] for q, n in self.conflicts[p] if self.chosen[self.owner[q]] == q}):
+                self._choose(j, self._best(j))
+            if self.cost < current:
+                return True
+            for j, q in enumerate(previous):
+                if self.chosen[j] != q:
+                    self._choose(j, q)
+        return False
+
+    @property
+    def texts(self):
+        """
+        :return: the list of the chosen possibilities, dicts linking the texts with their coordinates
+        """
+        return [self.possibilities[i][p - self.first[i]] for i, p in enumerate(self.chosen)]
+
+
+def place_texts(snapshot, transitions, seconds: float = None, rounds: int = 100):
+    """
+    Compute the coordinates of the texts of the transitions with a global placement,
+    an alternative to get_text_and_zone : the texts placed one after the other are repaired
+    until no text can move to a better possibility, or the rounds are done.
+    Without a time limit, the placement only depends on the transitions and the layout.
+
+    :param snapshot: the layout of the boxes related to the transitions
+    :param transitions: the transitions list
+    :param seconds: (optional) the time allowed to the placement, from the building of its conflict graph
+    :param rounds: the maximum number of rounds of the repair
+    :return: a list of dict linking the text with its coordinates
+    """
+    deadline = None if seconds is None else time.perf_counter() + seconds
+    placement = LabelPlacement(snapshot, transitions, deadline=deadline)
+    placement.greedy()
+    placement.repair(deadline, rounds)
+    return placement.texts
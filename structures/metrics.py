@@ -0,0 +1,91 @@
+from functools import lru_cache
+from typing import Dict
+
+
+class FixedWidthMetrics:
+    """
+    Measure of the texts where every character has the same width.
+
+    :param char_width: the width of a character
+    """
+
+    def __init__(self, char_width: float = 12):
+        self.char_width = char_width
+
+    def width(self, text: str, style: str = 'normal') -> float:
+        return len(text) * self.char_width
+
+
+class FontMetrics:
+    """
+    Measure of the texts with the advance widths of the glyphs of a font, in thousandths of the font size.
+
+    :param widths: the widths of the characters for each style ('normal', 'bold', 'italic')
+    :param size: the size of the font
+    :param default_width: the width of the characters missing from the tables
+    """
+
+    def __init__(self, widths: Dict[str, Dict[str, int]], size: float = 25, default_width: int = 556):
+        self.widths = widths
+        self.size = size
+        self.default_width = default_width
+
+    def width(self, text: str, style: str = 'normal') -> float:
+        widths = self.widths[style]
+        return sum(widths.get(char, self.default_width) for char in text) * self.size / 1000
+
+
+def _table(widths: str) -> Dict[str, int]:
+    # the widths of the printable ASCII characters, from the space to the tilde
+    return dict(zip(map(chr, range(32, 127)), map(int, widths.split())))
+
+
+# Arial shares the advance widths of Helvetica, the oblique style those of the regular one
+_arial_regular = _table('''
+    278 278 355 556 556 889 667 191 333 333 389 584 278 333 278 278 556 556 556 556 556 556 556 556 556 556
+    278 278 584 584 584 556 1015 667 667 722 722 667 611 778 722 278 500 667 556 833 722 778 667 778 722 667
+    611 722 667 944 667 667 611 278 278 278 469 556 333 556 556 500 556 556 278 556 556 222 222 500 222 833
+    556 556 556 556 333 500 278 556 500 722 500 500 500 334 260 334 584''')
+_arial_bold = _table('''
+    278 333 474 556 556 889 722 238 333 333 389 584 278 333 278 278 556 556 556 556 556 556 556 556 556 556
+    333 333 584 584 584 611 975 722 722 722 722 667 611 778 722 278 556 722 611 833 722 778 667 778 722 667
+    611 722 667 944 667 667 611 333 278 333 584 556 333 556 611 556 611 556 333 611 611 278 278 556 278 889
+    611 611 611 611 389 556 333 611 556 778 556 556 500 389 280 389 584''')
+
+# the fonts written by svgwriter : Arial at size 25, regular, bold and oblique
+arial = FontMetrics({'normal': _arial_regular, 'bold': _arial_bold, 'italic': _arial_regular}, size=25)
+fixed_width = FixedWidthMetrics()
+
+_metrics = fixed_width
+
+
+def set_text_metrics(metrics):
+    """
+    Select the measure of all the texts : the dimensions of the boxes and of the texts of the transitions
+    depend on it. The layouts of the boxes already built are solved again the next time they are read.
+
+    :param metrics: fixed_width (the default), arial, or any object with a method width(text, style)
+    """
+    global _metrics
+    _metrics = metrics
+
+
+def get_text_metrics():
+    """
+    :return: the measure of the texts in use
+    """
+    return _metrics
+
+
+@lru_cache(maxsize=4096)
+def _width(metrics, text, style):
+    return metrics.width(text, style)
+
+
+def text_width(text: str, style: str = 'normal') -> float:
+    """
+    :param text: a text on a single line
+    :param style: 'normal', 'bold' (the names of the boxes) or 'italic' (the entry, exit and parallel zones)
+    :return: the width of the text, measured with the metrics in use
+    """
+    return _width(_metrics, text, style)
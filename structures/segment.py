@@ -3,6 +3,8 @@ from typing import Dict, Tuple
 
 
 class Segment:
+    __slots__ = ('_p1', '_p2')
+
     def __init__(self, point1: Tuple[float, float], point2: Tuple[float, float]):
         self._p1 = point1
         self._p2 = point2
@@ -100,6 +102,32 @@ def intersect(segment1: Segment, segment2: Segment):
             return False
 
 
+def intersects_axis_aligned(p1, p2, p3, p4):
+    """
+    Boolean version of intersect for two horizontal or vertical segments [p1, p2] and [p3, p4]
+    (a point is a vertical segment) : they intersect if and only if their bounding boxes overlap,
+    borders included.
+
+    :return: True if the segments intersect
+    """
+    (x1, y1), (x2, y2), (x3, y3), (x4, y4) = p1, p2, p3, p4
+    return (x3 if x3 < x4 else x4) <= (x1 if x1 > x2 else x2) and \
+           (x1 if x1 < x2 else x2) <= (x3 if x3 > x4 else x4) and \
+           (y3 if y3 < y4 else y4) <= (y1 if y1 > y2 else y2) and \
+           (y1 if y1 < y2 else y2) <= (y3 if y3 > y4 else y4)
+
+
+def segments_intersect(segment1: Segment, segment2: Segment):
+    """
+    :return: True if intersect finds an intersection between the two segments,
+             computed without intersect when both segments are horizontal or vertical
+    """
+    (x1, y1), (x2, y2), (x3, y3), (x4, y4) = segment1._p1, segment1._p2, segment2._p1, segment2._p2
+    if (x1 == x2 or y1 == y2) and (x3 == x4 or y3 == y4):
+        return intersects_axis_aligned(segment1._p1, segment1._p2, segment2._p1, segment2._p2)
+    return bool(intersect(segment1, segment2))
+
+
 def get_box_segments(box: Box, coordinates: Dict[Box, Tuple[float, float, float, float]]) -> \
         (Segment, Segment, Segment, Segment):
     x1, y1, x2, y2 = coordinates[box]
@@ -0,0 +1,90 @@
+from collections.abc import Mapping
+from structures.segment import Segment
+
+
+class LayoutSnapshot(Mapping):
+    """
+    Frozen result of a layout : snapshot[box] is the rectangle (x1, y1, x2, y2) of the box.
+    The segments and the center of each box are computed once, the first time they are read.
+    Reading a snapshot never triggers a new layout.
+
+    :param coordinates: the coordinates of the boxes given by the layout
+    """
+    __slots__ = ('_coordinates', '_segments', '_centers')
+
+    def __init__(self, coordinates: Mapping):
+        object.__setattr__(self, '_coordinates', coordinates)
+        object.__setattr__(self, '_segments', {})
+        object.__setattr__(self, '_centers', {})
+
+    @property
+    def coordinates(self):
+        """
+        :return: the coordinates of the boxes from which this snapshot is built
+        """
+        return self._coordinates
+
+    def segments(self, box):
+        """
+        :return: the four segments (west, north, east, south) of the rectangle of the box
+        """
+        segments = self._segments.get(box)
+        if segments is None:
+            x1, y1, x2, y2 = self._coordinates[box]
+            segments = Segment((x1, y1), (x1, y2)), Segment((x1, y1), (x2, y1)), \
+                       Segment((x2, y1), (x2, y2)), Segment((x1, y2), (x2, y2))
+            self._segments[box] = segments
+        return segments
+
+    def center(self, box):
+        """
+        :return: the center (x, y) of the rectangle of the box
+        """
+        center = self._centers.get(box)
+        if center is None:
+            x1, y1, x2, y2 = self._coordinates[box]
+            center = (x1 + x2) / 2., (y1 + y2) / 2.
+            self._centers[box] = center
+        return center
+
+    def overlapping(self, x1, y1, x2, y2):
+        """
+        Find the boxes whose rectangles overlap the rectangle in parameter (borders included).
+        The tree of the boxes is used as a hierarchy of bounding volumes : a subtree is skipped
+        when the rectangle in parameter does not overlap the bounding box of the whole subtree,
+        and the coordinates of its boxes are never resolved.
+
+        :return: the list of the boxes found, in the order of the snapshot
+        """
+        index = getattr(self._coordinates, 'index', None)
+        if index is None:
+            return [box for box, (x3, y3, x4, y4) in self._coordinates.items()
+                    if x3 <= x2 and x1 <= x4 and y3 <= y2 and y1 <= y4]
+        subtree_bounds, boxes, end = self._coordinates.subtree_bounds, index.boxes, index.end
+        overlapping = []
+        i = 0
+        while i < len(boxes):
+            x3, y3, x4, y4 = subtree_bounds(i)
+            if x3 <= x2 and x1 <= x4 and y3 <= y2 and y1 <= y4:
+                x3, y3, x4, y4 = self._coordinates[boxes[i]]
+                if x3 <= x2 and x1 <= x4 and y3 <= y2 and y1 <= y4:
+                    overlapping.append(boxes[i])
+                i += 1
+            else:
+                i = end[i]
+        return overlapping
+
+    def __setattr__(self, attribute, value):
+        raise AttributeError('a LayoutSnapshot is immutable')
+
+    def __getitem__(self, box):
+        return self._coordinates[box]
+
+    def __iter__(self):
+        return iter(self._coordinates)
+
+    def __len__(self):
+        return len(self._coordinates)
+
+    def __repr__(self):
+        return 'LayoutSnapshot(' + repr(dict(self)) + ')'
@@ -1,8 +1,13 @@
 import math
+from functools import lru_cache
 import optimization
-from structures.box import space, char_width, char_height
-from structures.segment import Segment, get_box_segments, intersect
-from typing import Tuple, Dict, List
+import routing
+from structures.box import space, char_height
+from structures.metrics import text_width, get_text_metrics
+from structures.segment import Segment, segments_intersect
+from structures.snapshot import LayoutSnapshot
+from structures.batch import SegmentGrid
+from typing import Tuple, List
 
 
 class Transition:
@@ -15,7 +20,8 @@ class Transition:
         self._action = if_not_none(action)
         self._show_guard, self._show_action, self._show_event = True, True, True
         self._x1, self._x2, self._y1, self._y2 = math.inf, math.inf, math.inf, math.inf
-        self.polyline = []
+        self._polyline = ()
+        self._segments = None
 
     def copy(self):
         copy = Transition(self.source, self.target, self.guard, self.event, self.action)
@@ -23,6 +29,25 @@ class Transition:
         copy._x1, copy._y1, copy._x2, copy._y2 = self._x1, self._x2, self._y1, self._y2
         return copy
 
+    @property
+    def polyline(self):
+        """
+        The polyline is a tuple, so that it cannot be modified behind the cached segments :
+        to change it, assign a new sequence of points, e.g. a list, which is copied into a tuple.
+
+        :return: the tuple of the points of the polyline, empty if the transition is a direct line
+        """
+        return self._polyline
+
+    @polyline.setter
+    def polyline(self, points):
+        """
+        :param points: the points of the polyline (any sequence, e.g. a list), copied into a tuple ;
+                       an empty sequence for a direct line
+        """
+        self._polyline = tuple(points)
+        self._segments = None
+
     @property
     def guard(self):
         return {True: self._guard, False: ''}[self._show_guard]
@@ -71,21 +96,19 @@ class Transition:
         return self.source in self.target.ancestors
 
     @property
-    def segments(self) -> List[Segment]:
-        """
-        :return: The list of segments that compose the Transition
+    def segments(self) -> Tuple[Segment, ...]:
         """
+        The segments are computed once, until the polyline or the coordinates change.
 
-        def build(segments_list, i):
-            if i >= len(self.polyline) - 1:
-                return segments_list
+        :return: The tuple of segments that compose the Transition
+        """
+        if self._segments is None:
+            polyline = self._polyline
+            if polyline:
+                self._segments = tuple(Segment(polyline[i], polyline[i + 1]) for i in range(len(polyline) - 1))
             else:
-                return build(segments_list + [Segment(self.polyline[i], self.polyline[i + 1])], i + 1)
-
-        if self.polyline:
-            return build([], 0)
-        else:
-            return [Segment((self._x1, self._y1), (self._x2, self._y2))]
+                self._segments = (Segment((self._x1, self._y1), (self._x2, self._y2)),)
+        return self._segments
 
     def update_coordinates(self, start: Tuple[float, float], end: Tuple[float, float]):
         """
@@ -95,29 +118,40 @@ class Transition:
         """
         (x1, y1), (x2, y2) = start, end
         self._x1, self._x2, self._y1, self._y2 = x1, x2, y1, y2
+        self._segments = None
 
     def reset_coordinates(self):
         self.polyline = []
         self._x1, self._x2, self._y1, self._y2 = math.inf, math.inf, math.inf, math.inf
 
-    def conflicts_with_boxes(self, coordinates: Dict):
+    def conflicts_with_boxes(self, snapshot: LayoutSnapshot):
         """
         Compute the intersections with the boxes in parameter and this transition.
         Note that only the boxes intersected unrelated the source and the target will
         be added to the list returned.
-        :param coordinates: the dict linking the boxes with their coordinates
+        :param snapshot: the layout of the boxes
         :return: the list of boxes intersected
         """
 
+        segments = self.segments
+
         def conflict(box):
-            for segment1 in self.segments:
-                for segment2 in get_box_segments(box, coordinates):
-                    if intersect(segment1, segment2):
+            for segment1 in segments:
+                for segment2 in snapshot.segments(box):
+                    if segments_intersect(segment1, segment2):
                         return True
             return False
 
+        if all(segment.is_horizontal or segment.is_vertical for segment in segments):
+            # an axis-aligned segment can only intersect the boxes its bounding box touches
+            xs = [x for segment in segments for x in (segment.p1[0], segment.p2[0])]
+            ys = [y for segment in segments for y in (segment.p1[1], segment.p2[1])]
+            boxes = snapshot.overlapping(min(xs), min(ys), max(xs), max(ys))
+        else:
+            boxes = snapshot.keys()
+
         conflict_list = []
-        for box in coordinates.keys():
+        for box in boxes:
             if box not in self.target.ancestors and box != self.source and box != self.target:
                 if conflict(box):
                     conflict_list.append(box)
@@ -133,7 +167,7 @@ class Transition:
         def conflict(transition):
             for segment1 in self.segments:
                 for segment2 in transition.segments:
-                    if intersect(segment1, segment2):
+                    if segments_intersect(segment1, segment2):
                         return True
             return False
 
@@ -151,48 +185,88 @@ class Transition:
         return self.__str__()
 
 
+def _split_elements(elements, event, guard, action):
+    if len(elements) == 1:
+        elements = [event + guard, action[1:]]
+    elif len(elements) == 2:
+        elements = [event, guard, action[1:]]
+    else:
+        return elements
+    if '/ ' in elements:
+        elements.remove('/ ')
+    if '' in elements:
+        elements.remove('')
+    return elements
+
+
+@lru_cache(maxsize=1024)
+def _text_levels(guard: str, action: str, event: str, metrics):
+    """
+    :param metrics: the measure of the texts
+    :return: the formatted (event, guard, action) of a text zone, and the elements and the dimension
+             of the text zone at each split level (0 : not split, 1 : split once, 2 : split twice)
+    """
+    guard = {'': ''}.get(guard, '[' + guard + ']')
+    action = {event + guard: '', action: ' ' + action}.get(event + guard + action, ' / ' + action)
+    levels = []
+    elements = [event + guard + action]
+    for level in range(3):
+        if level:
+            elements = _split_elements(elements, event, guard, action)
+        dimension = max(map(metrics.width, elements)), len(elements) * char_height
+        levels.append((tuple(elements), dimension))
+    return (event, guard, action), tuple(levels)
+
+
+@lru_cache(maxsize=1024)
+def _text_templates(guard: str, action: str, event: str, metrics, vertical: bool, level: int):
+    """
+    :return: the possibilities of a text zone split level times along a horizontal or a vertical segment,
+             as tuples of (element, dx, dy) relative to the anchor of the segment
+    """
+    elements, (width, height) = _text_levels(guard, action, event, metrics)[1][level]
+    if vertical:
+        return tuple(tuple((element, dx, (i + 1) * char_height) for i, element in enumerate(elements))
+                     for dx in (-space / 2 - width, space / 2))
+    rows = [space / 8 + char_height * (i + 1) for i in range(len(elements))]
+    possibilities = [tuple(zip(elements, rows))]
+    for i in range(len(elements)):
+        rows = [row - char_height - (space if i == j else 0) for j, row in enumerate(rows)]
+        possibilities.append(tuple(zip(elements, rows)))
+    return tuple(tuple((element, space / 2, dy) for element, dy in possibility) for possibility in possibilities)
+
+
 class TextZone:
     """
     This object is used to arrange the text from a transition.
+    The split levels of the text and their dimensions are computed once for each (guard, action, event),
+    as well as the possibilities of the text along a segment for each orientation and split level.
 
     :param guard : the guard of a transition
     :param action : the action of a transition
     :param event : the event of a transition
     """
+    __slots__ = ('_key', '_event', '_guard', '_action', '_levels', '_level')
 
     def __init__(self, guard: str, action: str, event: str):
-        self._guard = {'': ''}.get(guard, '[' + guard + ']')
-        self._event = event
-        self._action = {event + guard: '', action: ' ' + action}.get(event + guard + action, ' / ' + action)
-        self._elements = [self._event + self._guard + self._action]
+        self._key = guard, action, event, get_text_metrics()
+        (self._event, self._guard, self._action), self._levels = _text_levels(*self._key)
+        self._level = 0
 
     def split(self):
-        elements = self.elements
-        if len(elements) == 1:
-            elements = [self._event + self._guard, self._action[1:]]
-            if '/ ' in elements:
-                elements.remove('/ ')
-            if '' in elements:
-                elements.remove('')
-        elif len(elements) == 2:
-            elements = [self._event, self._guard, self._action[1:]]
-            if '/ ' in elements:
-                elements.remove('/ ')
-            if '' in elements:
-                elements.remove('')
-        text_zone = TextZone('', '', self._event)
-        text_zone._guard = self._guard
-        text_zone._action = self._action
-        text_zone._elements = elements
+        text_zone = TextZone.__new__(TextZone)
+        for attribute in self.__slots__:
+            setattr(text_zone, attribute, getattr(self, attribute))
+        text_zone._level = min(self._level + 1, len(self._levels) - 1)
         return text_zone
 
     @property
     def elements(self) -> List[str]:
-        return self._elements[:]
+        return list(self._levels[self._level][0])
 
     @property
     def dimension(self) -> Tuple[float, float]:
-        return max(map(lambda x: len(x) * char_width, self._elements)), sum(map(lambda x: char_height, self._elements))
+        return self._levels[self._level][1]
 
     def coordinates_possibilities(self, segment: Segment):
         """
@@ -203,52 +277,51 @@ class TextZone:
                (usage : pass a segment from a polyline or direct line that compound a transition)
         :return: the list of coordinates possibilities for the text
         """
-        possibilities = []
-        text_zone = self
         insert = segment.p1
         end = segment.p2
+        level = self._level
         if segment.is_horizontal:
-            x = min(insert[0], end[0]) + space / 2
-            y = insert[1]
-            if segment.length - space < text_zone.dimension[0]:
-                text_zone = text_zone.split()
-            if segment.length - space < text_zone.dimension[0]:
-                text_zone = text_zone.split()
-            coordinates = {}
-            for i in range(len(text_zone._elements)):
-                element = text_zone._elements[i]
-                coordinates[element] = (x, y + space / 8 + char_height * (i + 1))
-            possibilities += [coordinates]
-            for i in range(len(text_zone._elements)):
-                coordinates = {}
-                for j in range(len(text_zone._elements)):
-                    element = text_zone._elements[j]
-                    if i == j:
-                        coordinates[element] = (x, possibilities[-1][element][1] - char_height - space)
-                    else:
-                        coordinates[element] = (x, possibilities[-1][element][1] - char_height)
-                possibilities += [coordinates]
+            x, y = min(insert[0], end[0]), insert[1]
+            for _ in range(2):
+                if segment.length - space < self._levels[level][1][0]:
+                    level = min(level + 1, len(self._levels) - 1)
+            templates = _text_templates(*self._key, False, level)
         elif segment.is_vertical:
-            x = insert[0]
-            y = min(insert[1], end[1]) + space / 2
+            x, y = insert[0], min(insert[1], end[1]) + space / 2
             if segment.length - space >= 2 * char_height:
-                text_zone = text_zone.split()
+                level = min(level + 1, len(self._levels) - 1)
             if segment.length - space >= 3 * char_height:
-                text_zone = text_zone.split()
-            coordinates1 = {}
-            coordinates2 = {}
-            for i in range(len(text_zone._elements)):
-                element = text_zone._elements[i]
-                coordinates1[element] = (x - space / 2 - text_zone.dimension[0], y + (i + 1) * char_height)
-                coordinates2[element] = (x + space / 2, y + (i + 1) * char_height)
-            possibilities = [coordinates1, coordinates2]
-        return possibilities
+                level = min(level + 1, len(self._levels) - 1)
+            templates = _text_templates(*self._key, True, level)
+        else:
+            return []
+        return [{element: (x + dx, y + dy) for element, dx, dy in template} for template in templates]
 
     def __repr__(self):
         return "event: " + self._event + "; guard: " + self._guard + "; action: " + self._action
 
 
-def count_text_intersections(text_dict, already_computed_texts, coordinates, transitions):
+def text_rectangle(text_dict) -> Tuple[float, float, float, float]:
+    """
+    :param text_dict: a dict linking the texts of a text zone with their insert coordinates
+    :return: the rectangle (x1, y1, x2, y2) around the texts
+    """
+    keys = text_dict.keys()
+    x1, y1 = min(map(lambda key: text_dict[key][0], keys)), min(map(lambda key: text_dict[key][1] - char_height, keys))
+    x2, y2 = max(map(lambda key: text_dict[key][0] + text_width(key), keys)), \
+             max(map(lambda key: text_dict[key][1], keys))
+    return x1, y1, x2, y2
+
+
+def text_edges(text_dict):
+    """
+    :return: the four sides (x1, y1, x2, y2) of the rectangle around the texts in parameter
+    """
+    x1, y1, x2, y2 = text_rectangle(text_dict)
+    return [(x1, y1, x1, y2), (x1, y1, x2, y1), (x2, y1, x2, y2), (x1, y2, x2, y2)]
+
+
+def count_text_intersections(text_dict, already_computed_texts, snapshot, transitions):
     """
     Compute and count the intersections of a text with boxes and transitions
 
@@ -256,66 +329,97 @@ def count_text_intersections(text_dict, already_computed_texts, coordinates, tra
            It represents a text zone of a transition (guard, event and action).
     :param already_computed_texts: it is a list of dict containing texts linking their coordinates
            which would cause intersections with text_dict.
-    :param coordinates: a dict such that the key is a box and the value is the coordinates of this box
+    :param snapshot: the layout of the boxes
     :param transitions: a list of transitions
     :return: the number of intersections of the text_dict with transitions, boxes and other texts
     """
+    boxes = SegmentGrid(segment for box in snapshot.keys() for segment in snapshot.segments(box))
+    routes = SegmentGrid(segment for transition in transitions for segment in transition.segments)
+    labels = SegmentGrid(Segment((x1, y1), (x2, y2))
+                         for text in already_computed_texts for x1, y1, x2, y2 in text_edges(text))
+    return _count_text_intersections(text_dict, boxes, routes, labels, len(transitions))
+
+
+def _count_text_intersections(text_dict, boxes, routes, labels, nb_transitions, bound=None):
+    edges = text_edges(text_dict)
+    # the intersections with the other texts are counted once per transition
+    # and we especially don't want them
+    weight = 4 * nb_transitions
+    if bound is None:
+        return boxes.count(edges) + routes.count(edges) + weight * labels.count(edges)
+    # the heaviest intersections first, to exceed the bound as soon as possible
+    score = weight * labels.count(edges, bound // weight)
+    if score <= bound:
+        score += boxes.count(edges, bound - score)
+    if score <= bound:
+        score += routes.count(edges, bound - score)
+    return score
+
+
+def best_possibility(possibilities, score):
+    """
+    Find the possibility with the lowest score, the first one of the list in case of a tie, by branch and bound :
+    the possibilities are scored with the best score found so far as a bound, beyond which the count stops.
+    The possibilities with the fewest lines (the unsplit ones) are tried first.
 
-    def compute_text_dimension(dict) -> Tuple[float, float, float, float]:
-        keys = dict.keys()
-        x1, y1 = min(map(lambda key: dict[key][0], keys)), min(map(lambda key: dict[key][1] - char_height, keys))
-        x2, y2 = max(map(lambda key: dict[key][0] + len(key) * char_width, keys)), \
-                 max(map(lambda key: dict[key][1], keys))
-        return x1, y1, x2, y2
-
-    def segments_zone(dict):
-        x1, y1, x2, y2 = compute_text_dimension(dict)
-        return Segment((x1, y1), (x1, y2)), Segment((x1, y1), (x2, y1)), \
-               Segment((x2, y1), (x2, y2)), Segment((x1, y2), (x2, y2))
-
-    counter = 0
-    for box in coordinates.keys():
-        for segment1 in segments_zone(text_dict):
-            for segment2 in get_box_segments(box, coordinates):
-                if intersect(segment1, segment2):
-                    counter += 1
-    for transition in transitions:
-        for segment1 in segments_zone(text_dict):
-            for segment2 in transition.segments:
-                if intersect(segment1, segment2):
-                    counter += 1
-            for text in already_computed_texts:
-                for segment2 in segments_zone(text):
-                    if intersect(segment1, segment2):
-                        counter += 4  # we especially don't want intersections between texts
-    return counter
-
-
-def get_text_and_zone(coordinates, transitions):
+    :param possibilities: the list of the possibilities
+    :param score: function giving the score of a possibility, or any number greater than the bound in parameter
+    :return: the best possibility
+    """
+    best, best_index = None, None
+    for i in sorted(range(len(possibilities)), key=lambda i: (len(possibilities[i]), i)):
+        if best is None:
+            best, best_index = score(possibilities[i], None), i
+            continue
+        # a possibility after the best one in the list must have a lower score
+        bound = best if i < best_index else best - 1
+        if bound < 0:
+            continue
+        value = score(possibilities[i], bound)
+        if value <= bound:
+            best, best_index = value, i
+    return possibilities[best_index]
+
+
+def text_possibilities(transition):
+    """
+    :return: the list of the possible coordinates of the text of the transition, along its segments
+             (along its longest vertical segment for a self transition)
+    """
+    possibilities = []
+    text = TextZone(transition.guard, transition.action, transition.event)
+    if transition.target != transition.source:
+        for segment in transition.segments:
+            possibilities += text.coordinates_possibilities(segment)
+    else:
+        possibilities += text.coordinates_possibilities(
+            max(filter(lambda segment: segment.is_vertical, transition.segments),
+                key=lambda segment: segment.length)
+        )
+    return possibilities
+
+
+def get_text_and_zone(snapshot, transitions):
     """
     Compute the coordinates of the texts (like guard, event, action) on the transitions.
+    The segments of the boxes, of the transitions and of the texts already placed are indexed
+    in uniform grids, and each possibility is only compared with the segments around it,
+    until it is known to be worse than the best one.
 
-    :param coordinates: a dict linking the boxes related to the transitions with their coordinates
+    :param snapshot: the layout of the boxes related to the transitions
     :param transitions: the transitions list
     :return: a list of dict linking the text with its coordinates
     """
     texts = []
+    boxes = SegmentGrid(segment for box in snapshot.keys() for segment in snapshot.segments(box))
+    routes = SegmentGrid(segment for transition in transitions for segment in transition.segments)
+    labels = SegmentGrid()
 
     for transition in transitions:
-        possibilities = []
-        text = TextZone(transition.guard, transition.action, transition.event)
-
-        if transition.target != transition.source:
-            for segment in transition.segments:
-                possibilities += text.coordinates_possibilities(segment)
-        else:
-            possibilities += text.coordinates_possibilities(
-                max(filter(lambda segment: segment.is_vertical, transition.segments),
-                    key=lambda segment: segment.length)
-            )
-
-        texts += [min(possibilities,
-                      key=lambda dict: count_text_intersections(dict, texts, coordinates, transitions))]
+        possibilities = text_possibilities(transition)
+        texts += [best_possibility(possibilities, lambda dict, bound: _count_text_intersections(
+            dict, boxes, routes, labels, len(transitions), bound))]
+        labels.extend(Segment((x1, y1), (x2, y2)) for x1, y1, x2, y2 in text_edges(texts[-1]))
 
     return texts
 
@@ -375,144 +479,143 @@ def acceptance_zone(box1, box2, axis, coordinates):
             return a, b
 
 
-def classic_arrow(transition, coordinates):
+class PortAssignment:
+    """
+    Slots of the transitions around the boxes of a layout : the transitions between the same two boxes
+    share the line between them, and the classic arrows leaving a box towards the same zone share its side.
+    The slots of the transitions of a box are all computed the first time one of them is asked.
+
+    :param snapshot: the layout of the boxes
+    """
+
+    def __init__(self, snapshot: LayoutSnapshot):
+        self._snapshot = snapshot
+        self._targets = {}  # box -> {target: the transitions from the box to the target}
+        self._parallel = {}  # transition -> (index, number) among the transitions between its source and its target
+        self._slots = {}  # transition -> (index, number) among the transitions leaving its source towards its zone
+
+    def _transitions_to(self, box):
+        targets = self._targets.get(box)
+        if targets is None:
+            targets = {}
+            for transition in box.transitions:
+                targets.setdefault(transition.target, []).append(transition)
+            self._targets[box] = targets
+        return targets
+
+    def parallel(self, transition):
+        """
+        :return: the index of the transition among the transitions between its source and its target
+                 (in both directions, ordered by names), and their number
+        """
+        if transition not in self._parallel:
+            source, target = transition.source, transition.target
+            transitions = self._transitions_to(source).get(target, []) + self._transitions_to(target).get(source, [])
+            transitions.sort(key=lambda t: t.source.name + t.target.name)
+            for i, t in enumerate(transitions):
+                if t.source is source:
+                    self._parallel[t] = i, len(transitions)
+        return self._parallel[transition]
+
+    def slot(self, transition):
+        """
+        :return: the index of the transition among the transitions leaving its source towards the same zone
+                 (ordered by the distance from the corner of the source to their targets), and their number
+        """
+        if transition not in self._slots:
+            source, snapshot = transition.source, self._snapshot
+            x1, y1, x2, y2 = snapshot[source]
+            zones = {}
+            for t in source.transitions:
+                zones.setdefault(zone_of(source, t.target, snapshot), []).append(t)
+            for zone, transitions in zones.items():
+                x = x1 if 'west' in zone else x2
+                y = y1 if 'north' in zone else y2
+                if source.parent.axis == 'horizontal':
+                    side = 2 if 'west' in zone else 0
+                    transitions.sort(key=lambda t: math.sqrt((x - snapshot[t.target][side]) ** 2 +
+                                                             (y - (snapshot[t.target][3] +
+                                                                   snapshot[t.target][1]) / 2) ** 2))
+                else:
+                    side = 3 if 'north' in zone else 1
+                    transitions.sort(key=lambda t: math.sqrt((x - (snapshot[t.target][0] +
+                                                                   snapshot[t.target][2]) / 2) ** 2 +
+                                                             (y - snapshot[t.target][side]) ** 2))
+                for i, t in enumerate(transitions):
+                    self._slots[t] = i, len(transitions)
+        return self._slots[transition]
+
+
+def classic_arrow(transition, snapshot, ports: PortAssignment = None):
     """
     Gives the polyline list for a classic transition arrow.
 
     :param transition: the transition that determines the polyline
-    :param coordinates: the coordinates of the boxes ; Dict[Box: (int, int)]
+    :param snapshot: the layout of the boxes
+    :param ports: (optional) the slots of the transitions in this layout
     :return: a list containing the points of the polyline
     """
+    if ports is None:
+        ports = PortAssignment(snapshot)
     source = transition.source
     target = transition.target
-    x1, y1, x2, y2 = coordinates[source]
-    x3, y3, x4, y4 = coordinates[target]
-
-    generate_list = lambda zone: list(
-        filter(lambda t: zone_of(source, t.target, coordinates) == zone, source.transitions))
-
-    if source.parent.axis == 'horizontal' and zone_of(source, target, coordinates) == 'northwest':
-        l = generate_list('northwest')
-        l.sort(key=lambda t: math.sqrt((x1 - coordinates[t.target][2]) ** 2 +
-                                       (y1 - (
-                                           coordinates[t.target][3] +
-                                           coordinates[t.target][1]) / 2) ** 2))
-        target_counter = len(l)
-        target_index = l.index(transition)
-        w = x2 - x1
-        x = x1 + w / (target_counter + 1) + target_index * w / (target_counter + 1)
-        y = (y3 + y4) / 2
-        return [(x, y1), (x, y), (x4, y)]
-    elif source.parent.axis == 'horizontal' and zone_of(source, target, coordinates) == 'northeast':
-        l = generate_list('northeast')
-        l.sort(key=lambda t: math.sqrt((x2 - coordinates[t.target][0]) ** 2 +
-                                       (y1 - (
-                                           coordinates[t.target][3] +
-                                           coordinates[t.target][1]) / 2) ** 2))
-        target_counter = len(l)
-        target_index = l.index(transition)
-        w = x2 - x1
-        x = x2 - w / (target_counter + 1) - target_index * w / (target_counter + 1)
-        y = (y3 + y4) / 2
-        return [(x, y1), (x, y), (x3, y)]
-    elif source.parent.axis == 'horizontal' and zone_of(source, target, coordinates) == 'southwest':
-        l = generate_list('southwest')
-        l.sort(key=lambda t: math.sqrt((x1 - coordinates[t.target][2]) ** 2 +
-                                       (y2 - (
-                                           coordinates[t.target][3] +
-                                           coordinates[t.target][1]) / 2) ** 2))
-        target_counter = len(l)
-        target_index = l.index(transition)
-        w = x2 - x1
-        x = x1 + w / (target_counter + 1) + target_index * w / (target_counter + 1)
-        y = (y3 + y4) / 2
-        return [(x, y2), (x, y), (x4, y)]
-    elif source.parent.axis == 'horizontal' and zone_of(source, target, coordinates) == 'southeast':
-        l = generate_list('southeast')
-        l.sort(key=lambda t: math.sqrt((x2 - coordinates[t.target][0]) ** 2 +
-                                       (y2 - (
-                                           coordinates[t.target][3] +
-                                           coordinates[t.target][1]) / 2) ** 2))
-        target_counter = len(l)
-        target_index = l.index(transition)
+    x1, y1, x2, y2 = snapshot[source]
+    x3, y3, x4, y4 = snapshot[target]
+    target_index, target_counter = ports.slot(transition)
+    zone = zone_of(source, target, snapshot)
+
+    if source.parent.axis == 'horizontal':
         w = x2 - x1
-        x = x2 - w / (target_counter + 1) - target_index * w / (target_counter + 1)
         y = (y3 + y4) / 2
-        return [(x, y2), (x, y), (x3, y)]
-    elif source.parent.axis == 'vertical' and zone_of(source, target, coordinates) == 'northwest':
-        l = generate_list('northwest')
-        l.sort(
-            key=lambda t: math.sqrt((x1 - (
-                coordinates[t.target][0] + coordinates[t.target][2]) / 2) ** 2 +
-                                    (y1 - coordinates[t.target][3]) ** 2))
-        target_counter = len(l)
-        target_index = l.index(transition)
-        h = y2 - y1
-        x = (x3 + x4) / 2
-        y = y1 + h / (target_counter + 1) + target_index * h / (target_counter + 1)
-        return [(x1, y), (x, y), (x, y4)]
-    elif source.parent.axis == 'vertical' and zone_of(source, target, coordinates) == 'northeast':
-        l = generate_list('northeast')
-        l.sort(
-            key=lambda t: math.sqrt((x2 - (
-                coordinates[t.target][0] + coordinates[t.target][2]) / 2) ** 2 +
-                                    (y1 - coordinates[t.target][3]) ** 2))
-        target_counter = len(l)
-        target_index = l.index(transition)
-        h = y2 - y1
-        x = (x3 + x4) / 2
-        y = y1 + h / (target_counter + 1) + target_index * h / (target_counter + 1)
-        return [(x2, y), (x, y), (x, y4)]
-    elif source.parent.axis == 'vertical' and zone_of(source, target, coordinates) == 'southwest':
-        l = generate_list('southwest')
-        l.sort(
-            key=lambda t: math.sqrt((x1 - (
-                coordinates[t.target][0] + coordinates[t.target][2]) / 2) ** 2 +
-                                    (y2 - coordinates[t.target][1]) ** 2))
-        target_counter = len(l)
-        target_index = l.index(transition)
-        h = y2 - y1
-        x = (x3 + x4) / 2
-        y = y2 - h / (target_counter + 1) - target_index * h / (target_counter + 1)
-        return [(x1, y), (x, y), (x, y3)]
+        if 'west' in zone:
+            x = x1 + w / (target_counter + 1) + target_index * w / (target_counter + 1)
+            end = (x4, y)
+        else:
+            x = x2 - w / (target_counter + 1) - target_index * w / (target_counter + 1)
+            end = (x3, y)
+        start = (x, y1) if 'north' in zone else (x, y2)
+        return [start, (x, y), end]
     else:
-        l = generate_list('southeast')
-        l.sort(
-            key=lambda t: math.sqrt((x2 - (
-                coordinates[t.target][0] + coordinates[t.target][2]) / 2) ** 2 +
-                                    (y2 - coordinates[t.target][1]) ** 2))
-        target_counter = len(l)
-        target_index = l.index(transition)
         h = y2 - y1
         x = (x3 + x4) / 2
-        y = y2 - h / (target_counter + 1) - target_index * h / (target_counter + 1)
-        return [(x2, y), (x, y), (x, y3)]
+        if 'north' in zone:
+            y = y1 + h / (target_counter + 1) + target_index * h / (target_counter + 1)
+            end = (x, y4)
+        else:
+            y = y2 - h / (target_counter + 1) - target_index * h / (target_counter + 1)
+            end = (x, y3)
+        start = (x1, y) if 'west' in zone else (x2, y)
+        return [start, (x, y), end]
+
+
+# the engines that improve the routes of the transitions in conflict
+routers = ('search', 'visibility')
 
 
-def update_transitions_coordinates(transitions, coordinates):
+def update_transitions_coordinates(transitions, snapshot, budget=None, workers=1, router='search'):
     """
     Update the coordinates of the transitions.
 
     :param transitions: a list of transitions
-    :param coordinates: a dict linking boxes (related with transitions) with their coordinates.
+    :param snapshot: the layout of the boxes related with the transitions
+    :param budget: (optional) the SearchBudget of the search of the routes, a single pass if None
+    :param workers: the number of processes of the search of the routes, the number of processors if None
+    :param router: the engine that improves the routes in conflict : 'search' (local search of detours)
+                   | 'visibility' (shortest routes in visibility graphs)
     """
+    if router not in routers:
+        raise ValueError('unknown router: ' + repr(router))
+    ports = PortAssignment(snapshot)
     for transition in transitions:
         # First check if it is possible to draw directly a transition in with one line.
         source = transition.source
         target = transition.target
-        x1, y1, x2, y2 = coordinates[source]
-        x3, y3, x4, y4 = coordinates[target]
+        x1, y1, x2, y2 = snapshot[source]
+        x3, y3, x4, y4 = snapshot[target]
         if source != target:
-            def generate_list():
-                l = list(filter(lambda t: t.target == target, source.transitions)) + list(
-                    filter(lambda t: t.target == source, target.transitions))
-                l.sort(key=lambda t: t.source.name + t.target.name)
-                return l
-
-            same_target_counter = len(generate_list())
-            same_target_index = generate_list().index(transition)
-            direction = zone_of(source, target, coordinates)
-            acc = acceptance_zone(source, target, 'horizontal', coordinates)
+            same_target_index, same_target_counter = ports.parallel(transition)
+            direction = zone_of(source, target, snapshot)
+            acc = acceptance_zone(source, target, 'horizontal', snapshot)
             # check if it is possible to join directly the target with one line
             if acc is not None:
                 transition.polyline = []
@@ -524,7 +627,7 @@ def update_transitions_coordinates(transitions, coordinates):
                     transition.update_coordinates(start=(x2, y), end=(x3, y))
             # vertical test
             else:
-                acc = acceptance_zone(source, target, 'vertical', coordinates)
+                acc = acceptance_zone(source, target, 'vertical', snapshot)
                 if acc is not None:
                     transition.polyline = []
                     w = acc[1] - acc[0]
@@ -541,8 +644,8 @@ def update_transitions_coordinates(transitions, coordinates):
                             transition.update_coordinates(start=(x1, (y3 + y4) / 2), end=(x3, (y3 + y4) / 2))
                         elif target.parent.childrent.index(target) == len(target.parent.children) - 1:
                             transition.update_coordinates(start=(x2, (y3 + y4) / 2), end=(x4, (y3 + y4) / 2))
-                        elif zone_of(source, target, coordinates) == 'northeast' or zone_of(source, target,
-                                                                                            coordinates) == 'northwest':
+                        elif zone_of(source, target, snapshot) == 'northeast' or zone_of(source, target,
+                                                                                            snapshot) == 'northwest':
                             transition.update_coordinates(start=((x3 + x4) / 2, y1), end=((x3 + x4) / 2, y3))
                         else:
                             transition.update_coordinates(start=((x3 + x4) / 2, y2), end=((x3 + x4) / 2, y4))
@@ -551,14 +654,14 @@ def update_transitions_coordinates(transitions, coordinates):
                             transition.update_coordinates(start=((x3 + x4) / 2, y1), end=((x3 + x4) / 2, y3))
                         elif target.parent.childrent.index(target) == len(target.parent.children) - 1:
                             transition.update_coordinates(start=((x3 + x4) / 2, y2), end=((x3 + x4) / 2, y4))
-                        elif zone_of(source, target, coordinates) == 'northwest' or zone_of(source, target,
-                                                                                            coordinates) == 'southwest':
+                        elif zone_of(source, target, snapshot) == 'northwest' or zone_of(source, target,
+                                                                                            snapshot) == 'southwest':
                             transition.update_coordinates(start=(x1, (y3 + y4) / 2), end=(x3, (y3 + y4) / 2))
                         else:
                             transition.update_coordinates(start=(x2, (y3 + y4) / 2), end=(x4, (y3 + y4) / 2))
                 else:
                     # classic arrow
-                    transition.polyline = classic_arrow(transition, coordinates)
+                    transition.polyline = classic_arrow(transition, snapshot, ports)
         else:
             # self transition
             if source.zone == 'north':
@@ -577,4 +680,7 @@ def update_transitions_coordinates(transitions, coordinates):
                                        (x2 + space, y2 + space), ((x1 + x2) / 2, y2 + space),
                                        ((x1 + x2) / 2, y2)]
 
-    optimization.transitions_local_search(transitions, coordinates)
+    if router == 'visibility':
+        routing.visibility_routing(transitions, snapshot)
+    elif router == 'search':
+        optimization.transitions_local_search(transitions, snapshot, budget, workers)
@@ -1,8 +1,12 @@
 import svgwrite
 
 from structures import transition
-from structures.box import Box, radius, char_width, char_height
+from structures.labels import place_texts, text_placements
+from structures.box import Box, radius, char_height, parallel_tag, entry_tag
+from structures.metrics import text_width
 from structures.box_elements import RootBox
+from structures.snapshot import LayoutSnapshot
+from optimization import SearchBudget
 
 normal_style = "font-size:25;font-family:Arial"
 italic_style = "font-size:25;font-family:Arial;font-style:oblique"
@@ -26,18 +30,18 @@ def get_shape(box: Box, insert):
         return svgwrite.shapes.Circle(center=(x + radius, y + radius), r=radius)
 
 
-def render_box(box: Box, coordinates):
+def render_box(box: Box, snapshot: LayoutSnapshot):
     """
     creates the shapes of the boxes and puts it in a svg group
 
-    :param coordinates: the coordinates dict of all boxes
+    :param snapshot: the layout of all boxes
     :param box: the box to render
     :return: the group that contains the box and their inner boxes
     """
     g = svgwrite.container.Group()
 
     # First draw the main box
-    x1, y1, x2, y2 = coordinates[box]
+    x1, y1, x2, y2 = snapshot[box]
     insert = x1, y1
     shape = get_shape(box, insert)
     if shape is not None:
@@ -46,46 +50,60 @@ def render_box(box: Box, coordinates):
     # Now draw the name of the box
     w, h = box.name_position(insert)
     if next(box.parallel_states, False):
-        t1 = svgwrite.text.Text("<<parallel>>", insert=(w, h), style=italic_style, textLength=13 * char_width)
-        t2 = svgwrite.text.Text(box.name, insert=(w + 14 * char_width, h), style=bold_style,
-                                textLength=len(box.name) * char_width)
+        t1 = svgwrite.text.Text(parallel_tag.strip(), insert=(w, h), style=italic_style,
+                                textLength=text_width(parallel_tag, 'italic'))
+        t2 = svgwrite.text.Text(box.name, insert=(w + text_width(parallel_tag, 'italic') + text_width(' '), h),
+                                style=bold_style, textLength=text_width(box.name, 'bold'))
         g.add(t1)
         g.add(t2)
     else:
-        g.add(svgwrite.text.Text(box.name, insert=(w, h), style=bold_style, textLength=len(box.name) * char_width))
+        g.add(svgwrite.text.Text(box.name, insert=(w, h), style=bold_style, textLength=text_width(box.name, 'bold')))
 
     # This draws the 'on entry' zone
     w, h = box.entry_position(insert)
     if box.entry != '':
         if not isinstance(box, RootBox):
-            g.add(svgwrite.text.Text("entry / ", insert=(w, h), style=italic_style, textLength=8 * char_width))
-            init_len = 9 * char_width
+            g.add(svgwrite.text.Text(entry_tag, insert=(w, h), style=italic_style,
+                                     textLength=text_width(entry_tag, 'italic')))
+            init_len = text_width(entry_tag, 'italic') + text_width(' ')
         else:
             init_len = 0
         i = 0
         for entry in box.entry.split('\n'):
             g.add(svgwrite.text.Text(entry, insert=(w + init_len, h + char_height * i), style=normal_style,
-                                     textLength=len(entry) * char_width))
+                                     textLength=text_width(entry)))
             i += 1
 
     w, h = box.exit_position(insert)
     if box.exit != '':
-        g.add(svgwrite.text.Text("exit / ", insert=(w, h), style=italic_style, textLength=8 * char_width))
+        # the exit texts are aligned on the entry ones
+        g.add(svgwrite.text.Text("exit / ", insert=(w, h), style=italic_style,
+                                 textLength=text_width("exit / ", 'italic')))
         i = 0
         for exit in box.exit.split('\n'):
-            g.add(svgwrite.text.Text(exit, insert=(w + 9 * char_width, h + char_height * i), style=normal_style,
-                                     textLength=len(exit) * char_width))
+            g.add(svgwrite.text.Text(exit, insert=(w + text_width(entry_tag, 'italic') + text_width(' '),
+                                                   h + char_height * i), style=normal_style,
+                                     textLength=text_width(exit)))
             i += 1
     # TODO : do zone
 
     # Finally draw the children following the axis (horizontal or vertical)
     for child in box.children:
-        g.add(render_box(child, coordinates))
+        g.add(render_box(child, snapshot))
 
     return g
 
 
-def render_transitions(transitions, coordinates):
+def render_transitions(transitions, snapshot: LayoutSnapshot, text_placement='sequential', text_seconds=None):
+    """
+    get the svg objects of the transitions and of their texts
+
+    :param text_placement: 'sequential' to place the texts one after the other,
+                           'global' to repair their placement as a whole
+    :param text_seconds: (optional) the time allowed to the global placement of the texts, no limit if None
+    """
+    if text_placement not in text_placements:
+        raise ValueError('unknown text placement: ' + repr(text_placement))
     lines = []
     for t in transitions:
         if t.polyline:
@@ -96,32 +114,53 @@ def render_transitions(transitions, coordinates):
             lines += [svgwrite.shapes.Line(start=(x1, y1), end=(x2, y2), stroke='black', stroke_width=1,
                                            marker_end="url(#arrow)")]
 
-    for dict in transition.get_text_and_zone(coordinates, transitions):
+    if text_placement == 'global':
+        texts = place_texts(snapshot, transitions, text_seconds)
+    else:
+        texts = transition.get_text_and_zone(snapshot, transitions)
+    for dict in texts:
         for text in dict.keys():
             lines += [
-                svgwrite.text.Text(text, insert=dict[text], style=normal_style, textLength=len(text) * char_width)]
+                svgwrite.text.Text(text, insert=dict[text], style=normal_style, textLength=text_width(text))]
 
     return lines
 
 
-def export(box: Box, file_name=''):
+def export(box: RootBox, file_name='', search_budget: SearchBudget = None, text_placement: str = None,
+           text_seconds: float = None):
     """
-    Creates the svg file that represents the Box
+    Creates the svg file that represents the statechart
 
-    :param box: the box that will be on the svg file
+    :param box: the root box that will be on the svg file
     :param file_name: the name of the file to create
+    :param search_budget: (optional) the budget of the search of the routes of the transitions,
+                          that replaces the one of the box for this export only
+    :param text_placement: (optional) 'sequential' or 'global', the placement of the texts of the transitions,
+                           that replaces the one of the box for this export only
+    :param text_seconds: (optional) the time allowed to the global placement of the texts,
+                         that replaces the one of the box for this export only
     """
     if not file_name:
         file_name = box.name
-    transitions = box.transitions
-    coordinates = box.coordinates
+    previous_budget = box.search_budget
+    if search_budget is not None:
+        box.search_budget = search_budget
+    try:
+        transitions = box.transitions
+    finally:
+        box.search_budget = previous_budget
+    snapshot = box.snapshot
     dwg = svgwrite.Drawing(file_name + ".svg", size=(box.width, box.height))
-    dwg.add(render_box(box, coordinates))
+    dwg.add(render_box(box, snapshot))
     marker = svgwrite.container.Marker(insert=(8, 3), orient='auto', markerWidth=30, markerHeight=20,
                                        id="arrow")
     path = svgwrite.path.Path(d="M0,0 L0,6 L9,3 z")
     marker.add(path)
     dwg.defs.add(marker)
-    for transition in render_transitions(transitions, coordinates):
+    if text_placement is None:
+        text_placement = box.text_placement
+    if text_seconds is None:
+        text_seconds = box.text_seconds
+    for transition in render_transitions(transitions, snapshot, text_placement, text_seconds):
         dwg.add(transition)
     dwg.save()
@@ -1,12 +1,39 @@
 from sismic import io
 import sismic
+import os
+import tempfile
 import unittest
+from random import Random
 
-from structures.segment import Segment, intersect, combined_segments, get_box_segments
+from structures.segment import Segment, intersect, combined_segments, get_box_segments, \
+    intersects_axis_aligned, segments_intersect
+import constraint_solver
+import tree_index
 from constraint_solver import Constraint
 from structures.box import Box
 from structures.box_elements import RootBox, InitBox
-from structures.transition import Transition
+from structures.transition import Transition, TextZone, PortAssignment, zone_of, best_possibility, get_text_and_zone, \
+    text_edges
+from structures.crossings import TransitionCrossings, ConflictMatrix
+from structures import batch, metrics
+from structures.labels import LabelPlacement, place_texts, edge_conflicts
+import optimization
+import svgwriter
+from optimization import SearchBudget
+from routing import VisibilityGraph, VisibilityRouter
+
+
+def groups_statechart():
+    """
+    :return: a statechart of 3 compound states, each containing 3 states connected with each other
+    """
+    lines = ['statechart:', '  name: groups', '  root state:', '    name: root', '    initial: g0', '    states:']
+    for g in range(3):
+        lines += ['    - name: g%d' % g, '      initial: g%ds0' % g, '      states:']
+        for i in range(3):
+            lines += ['      - name: g%ds%d' % (g, i), '        transitions:']
+            lines += ['        - target: g%ds%d' % (g, j) for j in range(3) if j != i]
+    return io.import_from_yaml('\n'.join(lines))
 
 
 class TestSegment(unittest.TestCase):
@@ -29,6 +56,18 @@ class TestSegment(unittest.TestCase):
         self.assertEqual(combined.p1, (4, 1))
         self.assertEqual(combined.p2, (6, 1))
 
+    def test_axis_aligned_intersection(self):
+        random = Random(0)
+
+        def segment():
+            x, y = random.randint(0, 8), random.randint(0, 8)
+            return Segment((x, y), random.choice([(x, random.randint(0, 8)), (random.randint(0, 8), y)]))
+
+        for i in range(2000):
+            s1, s2 = segment(), segment()
+            self.assertEqual(bool(intersect(s1, s2)), intersects_axis_aligned(s1.p1, s1.p2, s2.p1, s2.p2))
+        self.assertTrue(segments_intersect(Segment((0, 0), (4, 4)), Segment((0, 2), (4, 2))))
+
     def test_Box(self):
         box = Box('random')
         coordinates = {box: (10, 10, 30, 40)}
@@ -50,6 +89,11 @@ class TestTransitions(unittest.TestCase):
         for box in self.root_box.inner_states:
             self.states[box.name] = box
 
+    def total_conflicts(self):
+        transitions = self.root_box.transitions
+        conflicts = ConflictMatrix(transitions, self.root_box.snapshot)
+        return sum(conflicts.count(transition) for transition in transitions)
+
     def test_segment(self):
         for transition in self.root_box.transitions:
             segments = transition.segments
@@ -71,6 +115,227 @@ class TestTransitions(unittest.TestCase):
         self.assertEqual(intersect(Segment((0, 3), (6, 3)), Segment((5, 0), (5, 5))), (5, 3))
         self.assertEqual([t2, t3], t1.conflicts_with_transitions([t2, t3]))
 
+    def test_conflicts_with_boxes(self):
+        transitions = self.root_box.transitions
+        snapshot = self.root_box.snapshot
+
+        def conflicts(transition):
+            return [box for box in snapshot.keys()
+                    if box not in transition.target.ancestors and box not in (transition.source, transition.target)
+                    and any(intersect(s1, s2) for s1 in transition.segments for s2 in get_box_segments(box, snapshot))]
+
+        for transition in transitions:
+            self.assertEqual(conflicts(transition), transition.conflicts_with_boxes(snapshot))
+        transition = Transition(self.states['door opened'], self.states['cooking mode'])
+        x1, y1, x2, y2 = snapshot[self.root_box]
+        transition.polyline = [(x1, y1), ((x1 + x2) / 2, y1), ((x1 + x2) / 2, y2)]
+        self.assertTrue(transition.conflicts_with_boxes(snapshot))
+        self.assertEqual(conflicts(transition), transition.conflicts_with_boxes(snapshot))
+
+    def test_conflict_matrix(self):
+        transitions = self.root_box.transitions
+        snapshot = self.root_box.snapshot
+        conflicts = ConflictMatrix(transitions, snapshot)
+        x1, y1, x2, y2 = snapshot[self.root_box]
+        transitions[0].polyline = [(x1, y1), ((x1 + x2) / 2, y1), ((x1 + x2) / 2, y2)]
+        conflicts.update(transitions[0])
+        candidate = transitions[1].copy()
+        candidate.polyline = [(x1, (y1 + y2) / 2), (x2, (y1 + y2) / 2)]
+        for transition in transitions + [candidate]:
+            others = [other for other in transitions if other is not transition]
+            self.assertEqual(transition.conflicts_with_boxes(snapshot), conflicts.boxes(transition))
+            self.assertEqual(transition.conflicts_with_transitions(others), conflicts.crossings(transition))
+            self.assertEqual(len(transition.conflicts_with_boxes(snapshot)) +
+                             len(transition.conflicts_with_transitions(others)), conflicts.count(transition))
+
+    def test_cached_segments(self):
+        transition = Transition(Box('a'), Box('b'))
+        transition.update_coordinates((0, 0), (4, 0))
+        self.assertIs(transition.segments, transition.segments)
+        self.assertEqual([((0, 0), (4, 0))], [(s.p1, s.p2) for s in transition.segments])
+        points = [(0, 0), (0, 5), (4, 5)]
+        transition.polyline = points
+        points.append((4, 9))
+        self.assertEqual([((0, 0), (0, 5)), ((0, 5), (4, 5))], [(s.p1, s.p2) for s in transition.segments])
+        self.assertEqual(((0, 0), (0, 5), (4, 5)), transition.polyline)
+        with self.assertRaises(AttributeError):
+            transition.polyline.append((4, 9))
+        transition.reset_coordinates()
+        transition.update_coordinates((1, 1), (1, 3))
+        self.assertEqual([((1, 1), (1, 3))], [(s.p1, s.p2) for s in transition.segments])
+
+    def test_crossings(self):
+        random = Random(0)
+        transitions = []
+        for i in range(40):
+            transition = Transition(Box('b' + str(i)), Box('c' + str(i)))
+            points = [(random.randint(0, 20), random.randint(0, 20))]
+            for j in range(random.randint(1, 3)):
+                x, y = points[-1]
+                points.append((x, random.randint(0, 20)) if j % 2 else (random.randint(0, 20), y))
+            transition.polyline = points
+            transitions.append(transition)
+        transitions[0].polyline = [(0, 0), (5, 7)]
+        crossings = TransitionCrossings(transitions)
+        for transition in transitions:
+            self.assertEqual(transition.conflicts_with_transitions(transitions), crossings.crossings(transition))
+        transitions[1].polyline = [(3, 0), (3, 20), (15, 20)]
+        crossings.refresh(transitions[1])
+        candidate = transitions[2].copy()
+        candidate.polyline = [(0, 10), (20, 10)]
+        for transition in transitions + [candidate]:
+            self.assertEqual(transition.conflicts_with_transitions(transitions), crossings.crossings(transition))
+
+    def test_segment_grid(self):
+        random = Random(0)
+
+        def segment():
+            x, y = random.randint(0, 20), random.randint(0, 20)
+            return Segment((x, y), random.choice([(x, random.randint(0, 20)), (random.randint(0, 20), y),
+                                                  (random.randint(0, 20), random.randint(0, 20))]))
+
+        segments = [segment() for i in range(300)]
+        candidates = [(x, y, x + random.randint(0, 5), y) for x, y in [segment().p1 for i in range(20)]]
+        expected = sum(1 for x1, y1, x2, y2 in candidates for s in segments
+                       if intersect(Segment((x1, y1), (x2, y2)), s))
+        numpy, vectorized_pairs = batch.numpy, batch.vectorized_pairs
+        try:
+            for engine, pairs in {(numpy, 0), (numpy, vectorized_pairs), (None, 0)}:
+                batch.numpy, batch.vectorized_pairs = engine, pairs
+                for cell in [3, 100]:
+                    grid = batch.SegmentGrid(segments[:100], cell=cell)
+                    grid.extend(segments[100:])
+                    self.assertEqual(expected, grid.count(candidates))
+                    self.assertEqual(6, grid.count(candidates, 5))
+        finally:
+            batch.numpy, batch.vectorized_pairs = numpy, vectorized_pairs
+
+    def test_search_budget(self):
+        single_pass = self.total_conflicts()
+        self.root_box.search_budget = SearchBudget(evaluations=0)
+        initial = self.total_conflicts()
+        self.assertLessEqual(single_pass, initial)
+        for budget in [SearchBudget(rounds=3), SearchBudget(evaluations=5, rounds=3), SearchBudget(seconds=60)]:
+            self.root_box.search_budget = budget
+            self.assertLessEqual(self.total_conflicts(), initial)
+        with tempfile.TemporaryDirectory() as directory:
+            svgwriter.export(self.root_box, os.path.join(directory, 'microwave'), SearchBudget(rounds=2))
+        self.assertIs(budget, self.root_box.search_budget)
+
+    def test_best_possibility(self):
+        random = Random(0)
+        for i in range(200):
+            possibilities = [{str(j): (0, 0) for j in range(random.randint(1, 3))} for k in range(random.randint(1, 8))]
+            scores = [random.randint(0, 3) for possibility in possibilities]
+            ids = {id(possibility): score for possibility, score in zip(possibilities, scores)}
+            best = best_possibility(possibilities, lambda possibility, bound: ids[id(possibility)])
+            self.assertIs(possibilities[scores.index(min(scores))], best)
+        texts = get_text_and_zone(self.root_box.snapshot, self.root_box.transitions)
+        self.assertEqual(len(self.root_box.transitions), len(texts))
+
+    def test_text_zone(self):
+        text = TextZone('x > 1', 'send()', 'timer_tick')
+        self.assertEqual(['timer_tick[x > 1] / send()'], text.elements)
+        self.assertEqual(['timer_tick[x > 1]', '/ send()'], text.split().elements)
+        self.assertEqual(['timer_tick', '[x > 1]', '/ send()'], text.split().split().split().elements)
+        self.assertEqual((120, 60), text.split().split().dimension)
+        horizontal = text.coordinates_possibilities(Segment((100, 0), (0, 0)))
+        self.assertEqual(4, len(horizontal))
+        self.assertEqual({'timer_tick': (10, -17.5), '[x > 1]': (10, 22.5), '/ send()': (10, 42.5)}, horizontal[1])
+        vertical = TextZone('x > 1', 'send()', 'timer_tick').coordinates_possibilities(Segment((0, 0), (0, 100)))
+        self.assertEqual({'timer_tick': (-130, 30), '[x > 1]': (-130, 50), '/ send()': (-130, 70)}, vertical[0])
+        self.assertEqual({'timer_tick': (10, 30), '[x > 1]': (10, 50), '/ send()': (10, 70)}, vertical[1])
+        # the possibilities built from the same templates are distinct dicts
+        vertical[1]['timer_tick'] = None
+        self.assertEqual((10, 30), text.coordinates_possibilities(Segment((0, 0), (0, 100)))[1]['timer_tick'])
+
+    def test_label_placement(self):
+        snapshot, transitions = self.root_box.snapshot, self.root_box.transitions
+        placement = LabelPlacement(snapshot, transitions)
+        placement.greedy()
+        self.assertEqual(get_text_and_zone(snapshot, transitions), placement.texts)
+        cost = placement.cost
+        placement.repair()
+        self.assertLessEqual(placement.cost, cost)
+        # two texts put on each other are moved apart by the repair
+        p, q = next((p, q) for p, conflicts in enumerate(placement.conflicts) for q, n in conflicts)
+        i, j = placement.owner[p], placement.owner[q]
+        placement._choose(i, p)
+        placement._choose(j, q)
+        self.assertTrue(edge_conflicts(text_edges(placement.texts[i]), text_edges(placement.texts[j])))
+        placement.repair()
+        self.assertFalse(edge_conflicts(text_edges(placement.texts[i]), text_edges(placement.texts[j])))
+        self.assertEqual(place_texts(snapshot, transitions), place_texts(snapshot, transitions))
+        # the texts placed after the deadline keep their first possibility
+        late = LabelPlacement(snapshot, transitions, deadline=0)
+        self.assertEqual(list(range(len(transitions) + 1)), late.first)
+        self.assertEqual(len(transitions), len(place_texts(snapshot, transitions, seconds=0)))
+        with self.assertRaises(ValueError):
+            svgwriter.render_transitions(transitions, snapshot, 'glob')
+        with self.assertRaises(ValueError):
+            self.root_box.text_placement = 'glob'
+
+    def test_port_assignment(self):
+        snapshot = self.root_box.snapshot
+        ports = PortAssignment(snapshot)
+        for transition in self.root_box.transitions:
+            source, target = transition.source, transition.target
+            if source != target:
+                parallel = [t for t in source.transitions if t.target == target] + \
+                           [t for t in target.transitions if t.target == source]
+                parallel.sort(key=lambda t: t.source.name + t.target.name)
+                self.assertEqual((parallel.index(transition), len(parallel)), ports.parallel(transition))
+            index, number = ports.slot(transition)
+            self.assertEqual(number, len([t for t in source.transitions if zone_of(source, t.target, snapshot) ==
+                                          zone_of(source, target, snapshot)]))
+            self.assertLess(index, number)
+
+    def test_visibility_graph(self):
+        source, target = (20, 80, 60, 120), (240, 80, 280, 120)
+        self.assertEqual([(60, 100), (240, 100)], VisibilityGraph((0, 0, 300, 200), [], source, target).shortest_route())
+        route = VisibilityGraph((0, 0, 300, 200), [(120, 40, 180, 160)], source, target).shortest_route()
+        self.assertEqual([(40, 80), (40, 30), (260, 30), (260, 80)], route)
+        self.assertIsNone(VisibilityGraph((0, 0, 300, 200), [(100, 0, 200, 200)], source, target).shortest_route())
+
+    def test_visibility_routing(self):
+        self.root_box.search_budget = SearchBudget(evaluations=0)
+        initial = self.total_conflicts()
+        self.root_box.search_budget = None
+        self.root_box.router = 'visibility'
+        self.assertLess(self.total_conflicts(), initial)
+        for transition in self.root_box.transitions:
+            for segment in transition.segments:
+                self.assertTrue(segment.is_horizontal or segment.is_vertical)
+        with self.assertRaises(ValueError):
+            self.root_box.router = 'visiblity'
+        with open("tests/microwave.yaml", 'r') as stream, self.assertRaises(ValueError):
+            RootBox(io.import_from_yaml(stream), router='visiblity')
+
+    def test_visibility_router(self):
+        router = VisibilityRouter(self.root_box.snapshot)
+        transition = next(t for t in self.root_box.transitions if router.route(t.source, t.target) is not None)
+        route = router.route(transition.source, transition.target)
+        self.assertIs(route, router.route(transition.source, transition.target, lambda a, b: 0))
+        crossed = router.route(transition.source, transition.target, lambda a, b: (a, b) == (route[0], route[1]))
+        self.assertIsNot(route, crossed)
+        self.assertIs(route, router.route(transition.source, transition.target))
+
+    def test_parallel_search(self):
+        root_box = RootBox(groups_statechart())
+        transitions = root_box.transitions
+        conflicts = ConflictMatrix(transitions, root_box.snapshot)
+        components = optimization.conflict_components(transitions, root_box.snapshot, conflicts)
+        self.assertEqual(3, len(components))
+        for component in components:
+            self.assertEqual(1, len({transitions[i].source.parent for i in component}))
+        polylines = [transition.polyline for transition in transitions]
+        root_box.search_workers = 2
+        self.assertEqual(polylines, [transition.polyline for transition in root_box.transitions])
+        budgets = SearchBudget(seconds=2, evaluations=7, rounds=3).split([4, 1, 2])
+        self.assertEqual([4, 1, 2], [budget.evaluations for budget in budgets])
+        self.assertEqual({(2, 3)}, {(budget.seconds, budget.rounds) for budget in budgets})
+        self.assertEqual([1, 0, 0], [budget.evaluations for budget in SearchBudget(evaluations=1).split([3, 3, 3])])
+
 
 class TestBoxElements(unittest.TestCase):
     def setUp(self):
@@ -87,6 +352,114 @@ class TestBoxElements(unittest.TestCase):
         self.assertIn('south', self.root_box.zone(self.states['doorsOpen'], self.states['floorListener']))
         self.assertIn('east', self.root_box.zone(self.states['doorsClosed'], self.states['movingDown']))
 
+    def test_text_metrics(self):
+        self.assertEqual(5 * 12, metrics.text_width('doors'))
+        self.assertAlmostEqual(0.025 * (500 + 222 + 278 + 278), metrics.arial.width('ci t'))
+        self.assertLess(metrics.arial.width('illi'), metrics.arial.width('mmmm'))
+        self.assertLess(metrics.arial.width('doors'), metrics.arial.width('doors', 'bold'))
+        self.assertEqual(metrics.arial.width('doors'), metrics.arial.width('doors', 'italic'))
+        box = self.states['doorsOpen']
+        width = box.width
+        coordinates = dict(self.root_box.coordinates)
+        active = self.states['active']
+        active.coordinates
+        metrics.set_text_metrics(metrics.arial)
+        try:
+            self.assertIs(metrics.arial, metrics.get_text_metrics())
+            self.assertAlmostEqual(metrics.arial.width(box.name, 'bold'), metrics.text_width(box.name, 'bold'))
+            self.assertEqual(metrics.arial.width(box.name, 'bold') + 2 * 20, box.width)
+            # the layout of the boxes already built is solved again with the new measure
+            x1, y1, x2, y2 = self.root_box.coordinates[box]
+            self.assertAlmostEqual(box.width, x2 - x1)
+            # the coordinates cached in a compound box are dropped when an ancestor solves it again
+            x1, y1, x2, y2 = active.coordinates[active]
+            self.assertAlmostEqual(active.width, x2 - x1)
+        finally:
+            metrics.set_text_metrics(metrics.fixed_width)
+        self.assertEqual(width, box.width)
+        self.assertEqual(coordinates, dict(self.root_box.coordinates))
+
+
+class TestLayout(unittest.TestCase):
+    def setUp(self):
+        with open("tests/elevator.yaml", 'r') as stream:
+            statechart = io.import_from_yaml(stream)
+            assert isinstance(statechart, sismic.model.Statechart)
+        self.root_box = RootBox(statechart)
+
+    def test_cached_coordinates(self):
+        self.assertIs(self.root_box.coordinates, self.root_box.coordinates)
+
+    def test_invalidation(self):
+        coordinates = self.root_box.coordinates
+        doors_closed = self.root_box.get_box_by_name('doorsClosed')
+        doors_open = self.root_box.get_box_by_name('doorsOpen')
+        self.root_box.add_constraint(Constraint(doors_closed, 'south', doors_open))
+        self.assertIsNot(coordinates, self.root_box.coordinates)
+        self.assertIn('south', self.root_box.zone(doors_closed, doors_open))
+
+    def test_deep_nesting(self):
+        boxes = [Box('state' + str(i), axis=['horizontal', 'vertical'][i % 2]) for i in range(30)]
+        for parent, child in zip(boxes, boxes[1:]):
+            parent.add_child(child)
+            parent.add_child(Box(child.name + ' sibling'))
+        coordinates = boxes[0].coordinates
+        for parent, child in zip(boxes, boxes[1:]):
+            x1, y1, x2, y2 = coordinates[parent]
+            x3, y3, x4, y4 = coordinates[child]
+            self.assertTrue(x1 < x3 < x4 < x2 and y1 < y3 < y4 < y2)
+
+    def test_lazy_coordinates(self):
+        doors_closed = self.root_box.get_box_by_name('doorsClosed')
+        doors_open = self.root_box.get_box_by_name('doorsOpen')
+        stale = self.root_box.coordinates
+        before = dict(tree_index.index_of(self.root_box).place())
+        self.root_box.add_constraint(Constraint(doors_closed, 'south', doors_open))
+        # the coordinates are resolved from the dispositions solved before the constraint
+        self.assertEqual(before, dict(stale))
+        fresh = self.root_box.coordinates
+        x1, y1, x2, y2 = fresh[doors_closed.parent]
+        x3, y3, x4, y4 = fresh[doors_closed]
+        self.assertEqual((x3 - x1, y3 - y1, x4 - x1, y4 - y1), doors_closed.parent._layout[doors_closed])
+        # a search in a small rectangle resolves the coordinates of the visited subtrees only
+        snapshot = self.root_box.snapshot
+        x1, y1, x2, y2 = snapshot.coordinates[doors_open]
+        self.assertIn(doors_open, snapshot.overlapping(x1, y1, x1 + 1, y1 + 1))
+        self.assertIn(0, snapshot.coordinates._resolved)
+        self.assertEqual([box for box, (x3, y3, x4, y4) in snapshot.items() if x3 <= x1 + 1 and x1 <= x4 and
+                          y3 <= y1 + 1 and y1 <= y4], snapshot.overlapping(x1, y1, x1 + 1, y1 + 1))
+
+    def test_snapshot(self):
+        snapshot = self.root_box.snapshot
+        self.assertIs(snapshot, self.root_box.snapshot)
+        with self.assertRaises(AttributeError):
+            snapshot.segments = None
+        doors_closed = self.root_box.get_box_by_name('doorsClosed')
+        doors_open = self.root_box.get_box_by_name('doorsOpen')
+        x1, y1, x2, y2 = snapshot[doors_closed]
+        self.assertEqual(((x1 + x2) / 2, (y1 + y2) / 2), snapshot.center(doors_closed))
+        self.assertEqual([(s.p1, s.p2) for s in get_box_segments(doors_closed, snapshot)],
+                         [(s.p1, s.p2) for s in snapshot.segments(doors_closed)])
+        self.root_box.add_constraint(Constraint(doors_closed, 'south', doors_open))
+        self.assertIsNot(snapshot, self.root_box.snapshot)
+        self.assertNotIn('south', self.root_box.zone(doors_closed, doors_open, snapshot))
+        self.assertIn('south', self.root_box.zone(doors_closed, doors_open))
+
+    def test_tree_index(self):
+        index = tree_index.index_of(self.root_box)
+        self.assertIs(index, tree_index.index_of(self.root_box))
+        for i, box in enumerate(index.boxes):
+            self.assertEqual([index.boxes[j] for j in index.children(i)], box._children)
+            self.assertEqual([index.boxes[j] for j in index.ancestors(i)], box.ancestors)
+            self.assertEqual(len(box.ancestors), index.depth[i])
+            subtree = set(index.boxes[i:index.end[i]])
+            self.assertTrue(all(box in [b] + b.ancestors for b in subtree))
+        doors_open = self.root_box.get_box_by_name('doorsOpen')
+        doors_open.add_child(Box('new state'))
+        self.assertIsNot(index, tree_index.index_of(self.root_box))
+        self.assertIn('new state', [box.name for box in tree_index.index_of(self.root_box).boxes])
+        self.assertEqual(len(index) + 1, len(self.root_box.coordinates))
+
 
 class TestConstraints(unittest.TestCase):
     def setUp(self):
@@ -117,6 +490,100 @@ class TestConstraints(unittest.TestCase):
         self.assertEqual(
             {'south', 'east'}, set(self.root_box.zone(self.states['door opened'], self.states['door closed'])))
 
+    def test_incremental_resolution(self):
+        controller = self.states['controller']
+        self.root_box.coordinates
+        solver = controller._solver
+        self.root_box.add_constraint(Constraint(self.states['door opened'], 'south', self.states['door closed']))
+        self.root_box.coordinates
+        self.assertIs(solver, controller._solver)
+        dimensions = {child: child._layout[child][2:] for child in controller.children}
+        fresh = constraint_solver.resolve(controller, dimensions, controller._children, controller._constraints)
+        for child in controller.children:
+            self.assertEqual(controller._layout[child], fresh[child])
+
+    def test_degenerate_problems(self):
+        # removing a constraint from this degenerate chart may make Cassowary pivot forever,
+        # depending on the addresses of the objects
+        for attempt in range(5):
+            root_box = RootBox(groups_statechart())
+            coordinates = root_box.coordinates
+            for box in root_box.inner_states:
+                x1, y1, x2, y2 = coordinates[box.parent]
+                x3, y3, x4, y4 = coordinates[box]
+                self.assertTrue(x1 < x3 < x4 < x2 and y1 < y3 < y4 < y2)
+            first, second = root_box.get_box_by_name('g1s2'), root_box.get_box_by_name('g1s0')
+            root_box.add_constraint(Constraint(first, 'north', second))
+            self.assertIn('north', root_box.zone(first, second))
+
+    def test_order_pairs(self):
+        children = [Box('state' + str(i)) for i in range(60)]
+        self.assertEqual(set(zip(children, children[1:])), constraint_solver.order_pairs(children, []))
+        pairs = constraint_solver.order_pairs(children, [Constraint(children[1], 'south', children[0])])
+        self.assertIn((children[0], children[2]), pairs)
+        self.assertNotIn((children[0], children[1]), pairs)
+        self.assertEqual(59, len(pairs))
+
+    def test_difference_solver(self):
+        with open("tests/microwave.yaml", 'r') as stream:
+            statechart = io.import_from_yaml(stream)
+        root_box = RootBox(statechart, solver='difference')
+        coordinates = self.root_box.coordinates
+        for box in root_box.inner_states:
+            self.assertEqual(coordinates[self.states[box.name]], root_box.coordinates[box])
+        with self.assertRaises(ValueError):
+            root_box.solver = 'diference'
+        self.assertEqual('difference', root_box.solver)
+
+    def test_contradictory_constraints(self):
+        self.root_box.solver = 'difference'
+        self.root_box.add_constraint(Constraint(self.states['ready'], 'north', self.states['not ready']))
+        self.root_box.add_constraint(Constraint(self.states['not ready'], 'west', self.states['ready']))
+        self.root_box.add_constraint(Constraint(self.states['ready'], 'west', self.states['not ready']))
+        self.assertIn('north', self.root_box.zone(self.states['ready'], self.states['not ready']))
+        controller = self.states['controller']
+        states = [self.states['door closed'], self.states['door opened']]
+        dimensions = {child: child._layout[child][2:] for child in controller.children}
+        for solver in constraint_solver.solvers.values():
+            with self.assertRaises(constraint_solver.InfeasibleConstraintsError):
+                solver(controller).resolve(
+                    dimensions, controller._children,
+                    [Constraint(states[0], 'north', states[1]), Constraint(states[1], 'north', states[0])])
+        with self.assertRaises(TypeError):
+            constraint_solver.Solver(controller)
+
+    def test_constraint_cycle(self):
+        controller = self.states['door closed']
+        a, b, c = Box('a'), Box('b'), Box('c')
+        for box in [a, b, c]:
+            controller.add_child(box)
+        controller.add_constraint(Constraint(a, 'north', b))
+        controller.add_constraint(Constraint(b, 'north', c))
+        controller.add_constraint(Constraint(a, 'west', c))
+        with self.assertRaises(constraint_solver.InfeasibleConstraintsError) as cm:
+            controller.add_constraint(Constraint(c, 'north', a))
+        self.assertEqual(3, len(cm.exception.constraints))
+        controller.add_constraint(Constraint(c, 'east', b))
+        self.assertEqual(4, len(controller._constraints))
+        self.assertNotIn(Constraint(c, 'north', a), controller._constraints)
+        self.assertIn(Constraint(c, 'south', b), controller._constraints)
+
+    def test_constraint_equality(self):
+        a, b = Box('a'), Box('b')
+        constraint = Constraint(a, 'north', b)
+        self.assertEqual(constraint, Constraint(b, 'south', a))
+        self.assertEqual(hash(constraint), hash(Constraint(b, 'south', a)))
+        self.assertNotEqual(constraint, Constraint(a, 'south', b))
+        self.assertNotEqual(constraint, Constraint(a, 'west', b))
+        self.assertEqual(constraint_solver.precedence(constraint), (a, b, 'vertical'))
+        self.assertEqual(constraint_solver.precedence(Constraint(b, 'south', a)), (a, b, 'vertical'))
+        with self.assertRaises(AttributeError):
+            constraint.direction = 'south'
+        with self.assertRaises(ValueError):
+            Constraint(a, 'up', b)
+        with self.assertRaises(ValueError):
+            Constraint(b, 'up', a)
+
     def test_order_constraints(self):
         """
         test if the adding order of the constraints influences the coordinates of the statechart.
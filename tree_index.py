@@ -0,0 +1,194 @@
+from array import array
+from collections.abc import Mapping
+
+
+class TreeIndex:
+    """
+    Flat index of a tree of Boxes, built in a single pre-order pass.
+    The Boxes are identified by their rank in the pre-order : the root is 0 and
+    the subtree of the Box i is the range of ids [i, end[i]).
+    The arrays parent, first_child and next_sibling contain -1 when there is no such Box.
+    The transitions of the Box i are transitions[transition_start[i]:transition_start[i + 1]].
+
+    :param root: the root of the tree to index
+    """
+
+    def __init__(self, root):
+        self.boxes = []  # type: list[Box]
+        self.parent = array('l')
+        self.depth = array('l')
+        stack = [(root, -1, 0)]
+        while stack:
+            box, parent, depth = stack.pop()
+            self.boxes.append(box)
+            self.parent.append(parent)
+            self.depth.append(depth)
+            i = len(self.boxes) - 1
+            for child in reversed(box._children):
+                stack.append((child, i, depth + 1))
+
+        n = len(self.boxes)
+        self.ids = {box: i for i, box in enumerate(self.boxes)}  # type: Dict[Box, int]
+        self.first_child = array('l', [-1]) * n
+        self.next_sibling = array('l', [-1]) * n
+        self.end = array('l', [n]) * n
+        self.transitions = []  # type: list[Transition]
+        self.transition_start = array('l')
+        for i, box in enumerate(self.boxes):
+            if box._children:
+                self.first_child[i] = i + 1
+            previous = -1
+            for child in box._children:
+                j = self.ids[child]
+                if previous >= 0:
+                    self.next_sibling[previous] = j
+                previous = j
+            if i > 0:
+                self.end[i] = self.next_sibling[i] if self.next_sibling[i] >= 0 else self.end[self.parent[i]]
+            self.transition_start.append(len(self.transitions))
+            self.transitions.extend(box._transitions)
+        self.transition_start.append(len(self.transitions))
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def children(self, i):
+        """
+        :return: an iterator on the ids of the children of the Box i
+        """
+        child = self.first_child[i]
+        while child >= 0:
+            yield child
+            child = self.next_sibling[child]
+
+    def ancestors(self, i):
+        """
+        :return: the list of the ids of the ancestors of the Box i, from its parent to the root
+        """
+        ancestors = []
+        i = self.parent[i]
+        while i >= 0:
+            ancestors.append(i)
+            i = self.parent[i]
+        return ancestors
+
+    def descendant_transitions(self, i):
+        """
+        :return: the transitions whose source is a descendant of the Box i, in pre-order
+        """
+        return self.transitions[self.transition_start[i + 1]:self.transition_start[self.end[i]]]
+
+    def place(self):
+        """
+        The dispositions of the Boxes are stored relatively to their parents : the absolute coordinates
+        of a Box are only resolved when they are read, from the closest resolved ancestor.
+        The dispositions of the whole tree must be solved.
+
+        :return: the absolute coordinates of the Boxes, the root being placed at (0, 0)
+        """
+        return Coordinates(self)
+
+
+class Coordinates(Mapping):
+    """
+    Read-only dictionary {Box : (x1, y1, x2, y2)} of the absolute coordinates of the Boxes of a TreeIndex.
+    It keeps the solved dispositions of the moment it is created : the offset of each Box is
+    translated at most once, when the coordinates of the Box or of one of its descendants are read.
+
+    :param index: the index of the tree, whose dispositions are solved
+    """
+
+    def __init__(self, index: TreeIndex):
+        self._index = index
+        self._layouts = [box._layout for box in index.boxes]
+        self._values = array('d', [0.]) * (4 * len(index))
+        self._resolved = bytearray(len(index))
+
+    @property
+    def index(self):
+        """
+        :return: the index of the tree of the boxes
+        """
+        return self._index
+
+    def __getitem__(self, box):
+        i = self._index.ids[box]
+        if not self._resolved[i]:
+            self._resolve(i)
+        values, i = self._values, 4 * i
+        return values[i], values[i + 1], values[i + 2], values[i + 3]
+
+    def _resolve(self, i):
+        parent, boxes, values, resolved = self._index.parent, self._index.boxes, self._values, self._resolved
+        path = []
+        while i >= 0 and not resolved[i]:
+            path.append(i)
+            i = parent[i]
+        for i in reversed(path):
+            p = parent[i]
+            if p < 0:
+                x, y = 0, 0
+                x1, y1, x2, y2 = self._layouts[i][boxes[i]]
+            else:
+                x, y = values[4 * p], values[4 * p + 1]
+                x1, y1, x2, y2 = self._layouts[p][boxes[i]]
+            j = 4 * i
+            values[j] = x + x1
+            values[j + 1] = y + y1
+            values[j + 2] = x + x2
+            values[j + 3] = y + y2
+            resolved[i] = 1
+
+    def subtree_bounds(self, i):
+        """
+        The bounds of the descendants, relative to their Box, are kept in the Box with its disposition :
+        they are computed again only for the Boxes solved again, and without translating any descendant.
+
+        :return: the bounding box (x1, y1, x2, y2) of the Box i and of all its descendants
+        """
+        if not self._resolved[i]:
+            self._resolve(i)
+        values, j = self._values, 4 * i
+        x1, y1, x2, y2 = values[j], values[j + 1], values[j + 2], values[j + 3]
+        extent = self._extent(i)
+        if extent is None:
+            return x1, y1, x2, y2
+        x, y = x1, y1
+        return min(x1, x + extent[0]), min(y1, y + extent[1]), max(x2, x + extent[2]), max(y2, y + extent[3])
+
+    def _extent(self, i):
+        box, layout = self._index.boxes[i], self._layouts[i]
+        if box._extent is not None and box._extent[0] is layout:
+            return box._extent[1]
+        extent = None
+        for c in self._index.children(i):
+            x1, y1, x2, y2 = layout[self._index.boxes[c]]
+            child = self._extent(c)
+            if child is not None:
+                x, y = x1, y1
+                x1, y1, x2, y2 = min(x1, x + child[0]), min(y1, y + child[1]), \
+                                 max(x2, x + child[2]), max(y2, y + child[3])
+            if extent is not None:
+                x1, y1, x2, y2 = min(x1, extent[0]), min(y1, extent[1]), max(x2, extent[2]), max(y2, extent[3])
+            extent = x1, y1, x2, y2
+        # a Box solved again gets a new disposition, and so do its ancestors
+        box._extent = layout, extent
+        return extent
+
+    def __iter__(self):
+        return iter(self._index.boxes)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __repr__(self):
+        return 'Coordinates(' + repr(dict(self)) + ')'
+
+
+def index_of(box):
+    """
+    :return: the index of the tree of the box in parameter, built if it is missing
+    """
+    if box._index is None:
+        box._index = TreeIndex(box)
+    return box._index